@@ -0,0 +1,116 @@
+""" Fast lookup of which stored assemblies a set of winners overlaps.
+
+Association, pattern completion and overlap experiments compare a fresh set of winners with many reference assemblies.
+Doing so with 'brain_util.overlap' builds two sets per pair, costing O(#assemblies * k) per query. An AssemblyIndex
+keeps, for every area, an inverted index from neuron to the assemblies containing it, stored as two arrays
+(CSR-style), so a query only touches the postings of its k winners.
+
+Example:
+    index = AssemblyIndex()
+    index.register("A", "stimA", b.areas["A"].winners)
+    ...
+    name, overlap = index.best_match("A", b.areas["A"].winners)
+
+Assemblies are sets of support indices, so they must be registered again after 'Brain.compact' renumbers the support.
+Rows of 'Brain.winners_history' mark neurons dropped by 'Brain.compact' as -1; these are ignored, both in registered
+assemblies and in queries.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+
+class _AreaIndex:
+    """ The assemblies of a single area, and the inverted index over them.
+
+    Attributes:
+        names: Name of each assembly, by assembly id.
+        sizes: Number of neurons in each assembly, by assembly id.
+        indptr: The assemblies containing neuron i are postings[indptr[i]:indptr[i + 1]].
+        postings: Assembly ids, grouped by neuron.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.sizes: List[int] = []
+        self._members: List[ndarray] = []
+        self.indptr: ndarray = np.zeros(1, dtype=int)
+        self.postings: ndarray = np.zeros(0, dtype=int)
+        self._dirty = False
+
+    def add(self, name: str, winners: Sequence[int]) -> None:
+        if name in self.ids:
+            raise ValueError("Assembly " + name + " is already registered")
+        members = np.unique(np.asarray(winners, dtype=int))
+        members = members[members >= 0]
+        self.ids[name] = len(self.names)
+        self.names.append(name)
+        self.sizes.append(len(members))
+        self._members.append(members)
+        self._dirty = True
+
+    def _build(self) -> None:
+        neurons = np.concatenate(self._members)
+        assemblies = np.repeat(np.arange(len(self._members)), [len(m) for m in self._members])
+        order = np.argsort(neurons, kind='stable')
+        self.postings = assemblies[order]
+        counts = np.bincount(neurons, minlength=1)
+        self.indptr = np.concatenate(([0], np.cumsum(counts)))
+        self._dirty = False
+
+    def overlaps(self, winners: Sequence[int]) -> Tuple[ndarray, ndarray]:
+        """ The ids of all assemblies sharing neurons with 'winners', and the size of each overlap. """
+        if self._dirty:
+            self._build()
+        neurons = np.unique(np.asarray(winners, dtype=int))
+        neurons = neurons[(neurons >= 0) & (neurons < len(self.indptr) - 1)]
+        starts = self.indptr[neurons]
+        lengths = self.indptr[neurons + 1] - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.unique(self.postings[positions], return_counts=True)
+
+
+class AssemblyIndex:
+    """ Named reference assemblies of any number of areas, indexed for overlap queries with winner sets. """
+
+    def __init__(self):
+        self._areas: Dict[str, _AreaIndex] = {}
+
+    def register(self, area: str, name: str, winners: Sequence[int]) -> None:
+        """ Store 'winners' (e.g. a copy of 'Area.winners') as the assembly 'name' of 'area'. """
+        self._areas.setdefault(area, _AreaIndex()).add(name, winners)
+
+    def assemblies(self, area: str) -> List[str]:
+        """ Names of the assemblies registered for 'area'. """
+        return list(self._areas[area].names) if area in self._areas else []
+
+    def overlaps(self, area: str, winners: Sequence[int]) -> Dict[str, int]:
+        """ The overlap of 'winners' with every assembly of 'area' that it intersects. """
+        if area not in self._areas:
+            return {}
+        index = self._areas[area]
+        ids, counts = index.overlaps(winners)
+        return {index.names[i]: int(c) for i, c in zip(ids, counts)}
+
+    def top(self, area: str, winners: Sequence[int], m: int = 1,
+            fraction: bool = False) -> List[Tuple[str, float]]:
+        """ The 'm' assemblies of 'area' with the largest overlap with 'winners', in decreasing order.
+
+        :param fraction: Report each overlap as a fraction of the assembly size instead of a count
+            (and rank by that fraction).
+        """
+        if area not in self._areas:
+            return []
+        index = self._areas[area]
+        ids, counts = index.overlaps(winners)
+        scores = counts / np.asarray(index.sizes)[ids] if fraction else counts
+        best = np.lexsort((ids, -scores))[:m]
+        return [(index.names[ids[i]], float(scores[i]) if fraction else int(scores[i])) for i in best]
+
+    def best_match(self, area: str, winners: Sequence[int],
+                   fraction: bool = False) -> Optional[Tuple[str, float]]:
+        """ The assembly of 'area' overlapping 'winners' the most, with its overlap, or None if there is no overlap. """
+        best = self.top(area, winners, 1, fraction)
+        return best[0] if best else None
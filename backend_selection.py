@@ -0,0 +1,185 @@
+""" Automatic choice of the storage backend of every connectome, for Brain(connectome_backend="auto").
+
+Connectomes of different area pairs are used very differently. The self-connectome of an area that keeps
+re-firing the same assembly accumulates potentiated weights in its winner block, and its rows are gathered every
+round, while a connectome between areas that rarely project into each other stays a Bernoulli(p) matrix that is
+mostly grown, never read. A BackendSelector follows, for every connectome:
+    - its access pattern, derived from the routing of every projection: rows gathered into input sums, cells
+      potentiated, and rounds in which its target area (columns) or source area (rows) recruited new neurons;
+    - its composition, estimated every 'interval' rounds: the fraction of synapses that exist, and the fraction of
+      those with a weight other than 1. Potentiation only writes into the rows of the winners of the source area,
+      so the rows of its current winners are counted exactly and the others from a sample of 'sample_rows' rows;
+      an evaluation reads about (k + sample_rows) rows of each connectome instead of scanning it.
+
+From these it predicts, for each candidate backend, the bytes a round touches (reading rows, growing, potentiating)
+plus 'memory_weight' times the bytes it keeps. A connectome migrates at a round boundary when another backend is
+cheaper by more than 'hysteresis', and the saving over 'horizon' rounds pays for the copy. The model only has to
+rank the backends, not to predict time, so costs are in bytes throughout:
+    - "dense": 8 bytes per cell. Every gathered row reads a full row, and every append copies the whole matrix.
+    - "packed": 1 bit per cell plus 16 bytes per weight other than 0 and 1 (see 'connectome.PackedConnectome').
+      Gathered rows are unpacked (about a byte per cell), appends mostly fill reserved capacity, and potentiation
+      re-sorts the overlay of weights other than 1.
+    - "float32": like "dense" at 4 bytes per cell. It rounds the weights, which changes the results, so it is only a
+      candidate if asked for, e.g. with 'brain.backend_selector = BackendSelector(("dense", "float32", "packed"))'.
+
+With the default candidates the results are exactly those of the "dense" backend: the input sums of "packed" are
+identical to dense ones, except in the columns it rescales for 'Area.normalize', so connectomes into normalized
+areas stay dense.
+
+'Brain.backend_report' lists the current backend, measurements, predicted costs and migrations of every connectome.
+"""
+import math
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+from connectome import backend_name, convert
+
+AUTO_BACKENDS = ("dense", "packed")
+
+
+class _Usage:
+    """ What is known about the use of a single connectome.
+
+    Attributes:
+        rounds: Projections observed since the last evaluation.
+        gathered: Rows gathered into input sums since the last evaluation.
+        potentiated: Cells potentiated since the last evaluation.
+        grown: Rounds since the last evaluation in which columns or rows were appended.
+        density: Estimated fraction of existing synapses at the last evaluation.
+        non_binary: Estimated fraction of the existing synapses with a weight other than 1 at the last evaluation.
+        costs: Predicted bytes per round of each candidate backend at the last evaluation.
+        last_migration: Round of the last migration; a connectome migrates at most once every 'horizon' rounds.
+        migrations: (round, old backend, new backend) of every migration.
+    """
+
+    def __init__(self):
+        self.rounds = 0
+        self.gathered = 0
+        self.potentiated = 0
+        self.grown = 0
+        self.density = 0.0
+        self.non_binary = 0.0
+        self.costs: Dict[str, float] = {}
+        self.last_migration = 0
+        self.migrations: List[Tuple[int, str, str]] = []
+
+
+class BackendSelector:
+    """ Chooses and migrates the backend of every connectome of a brain, at round boundaries (see the module).
+
+    :param backends: The candidate backends, among 'connectome.BACKENDS'.
+    :param interval: Rounds between evaluations.
+    :param horizon: Rounds over which a migration has to pay for itself.
+    :param hysteresis: Relative saving below which a connectome is not migrated.
+    :param memory_weight: Bytes of cost per byte kept, per round.
+    :param sample_rows: Rows outside the winners of the source area sampled to estimate the composition.
+    """
+
+    def __init__(self, backends: Sequence[str] = AUTO_BACKENDS, interval: int = 5, horizon: int = 20,
+                 hysteresis: float = 0.2, memory_weight: float = 0.1, sample_rows: int = 256):
+        self.backends = tuple(backends)
+        self.interval = interval
+        self.horizon = horizon
+        self.hysteresis = hysteresis
+        self.memory_weight = memory_weight
+        self.sample_rows = sample_rows
+        self.rounds = 0
+        self.usage: Dict[Tuple[str, str], _Usage] = {}
+        self._support_sizes: Dict[str, int] = {}
+        # private, so that sampling does not change the global generators that simulations draw from
+        self._rng = np.random.default_rng(0)
+
+    def observe(self, brain: Any, area_in: Mapping[str, List[str]], to_update: List[str], rounds: int = 1) -> None:
+        """ Account for 'rounds' projections with the given routing, and evaluate the connectomes when it is time. """
+        grown = {}
+        for name, area in brain.areas.items():
+            growth = area.support_size - self._support_sizes.get(name, 0)
+            grown[name] = min(rounds, max(growth, 0))
+            self._support_sizes[name] = area.support_size
+        for from_area in brain.areas:
+            for to_area in brain.areas:
+                usage = self.usage.setdefault((from_area, to_area), _Usage())
+                usage.rounds += rounds
+                usage.grown += max(grown[from_area], grown[to_area])
+        for to_area in to_update:
+            for from_area in area_in.get(to_area, []):
+                usage = self.usage[(from_area, to_area)]
+                usage.gathered += rounds * brain.areas[from_area].k
+                usage.potentiated += rounds * brain.areas[from_area].k * brain.areas[to_area].k
+        previous, self.rounds = self.rounds, self.rounds + rounds
+        if self.rounds // self.interval > previous // self.interval:
+            self.evaluate(brain)
+
+    def costs(self, usage: _Usage, shape: Tuple[int, int]) -> Dict[str, float]:
+        """ Predicted bytes per round of every candidate backend for a connectome of the given shape and usage. """
+        rows, columns = shape
+        cells = rows * columns
+        rounds = max(usage.rounds, 1)
+        gathered, potentiated, grown = usage.gathered / rounds, usage.potentiated / rounds, usage.grown / rounds
+        overlay = usage.density * usage.non_binary * cells
+        costs = {}
+        for backend in self.backends:
+            memory = self._memory(backend, usage, shape)
+            if backend in ("dense", "float32"):
+                size = 8 if backend == "dense" else 4
+                work = size * gathered * columns + memory * grown + 2 * size * potentiated
+            else:
+                work = (gathered * columns * 1.125 + (rows + columns) * grown +
+                        16 * overlay * math.log2(overlay + 2) * min(potentiated, 1) + 16 * potentiated)
+            costs[backend] = work + self.memory_weight * memory
+        return costs
+
+    def evaluate(self, brain: Any) -> None:
+        """ Measure every connectome, and migrate those for which another backend is worth it. """
+        for (from_area, to_area), usage in self.usage.items():
+            connectome = brain.connectomes[from_area][to_area]
+            rows, columns = connectome.shape
+            if rows * columns:
+                usage.density, usage.non_binary = self._composition(connectome, brain.areas[from_area].winners)
+            usage.costs = self.costs(usage, (rows, columns))
+            if brain.areas[to_area].normalize:
+                usage.costs.pop("packed", None)
+            current = backend_name(connectome)
+            best = min(usage.costs, key=usage.costs.get) if usage.costs else current
+            if current in usage.costs and best != current:
+                saving = usage.costs[current] - usage.costs[best]
+                copy = self._memory(current, usage, (rows, columns)) + self._memory(best, usage, (rows, columns))
+                if (saving > self.hysteresis * usage.costs[current] and saving * self.horizon > copy and
+                        (not usage.migrations or self.rounds - usage.last_migration >= self.horizon)):
+                    brain.connectomes[from_area][to_area] = convert(connectome, best, brain.areas[to_area].n,
+                                                                    brain.scratch_dir)
+                    usage.migrations.append((self.rounds, current, best))
+                    usage.last_migration = self.rounds
+            usage.rounds = usage.gathered = usage.potentiated = usage.grown = 0
+
+    def _composition(self, connectome: Any, winners: List[int]) -> Tuple[float, float]:
+        """ The estimated density of a connectome, and fraction of its synapses with a weight other than 1. """
+        rows, columns = connectome.shape
+        exact = np.unique(np.asarray(winners, dtype=np.int64))
+        exact = exact[exact < rows]
+        rest = np.setdiff1d(np.arange(rows), exact, assume_unique=True)
+        sample = rest
+        if len(rest) > self.sample_rows:
+            sample = np.sort(self._rng.choice(rest, self.sample_rows, replace=False))
+        nonzero, non_binary = connectome.count_weights(exact)
+        sampled_nonzero, sampled_non_binary = connectome.count_weights(sample)
+        scale = len(rest) / len(sample) if len(sample) else 0.0
+        nonzero, non_binary = nonzero + scale * sampled_nonzero, non_binary + scale * sampled_non_binary
+        return nonzero / (rows * columns), non_binary / nonzero if nonzero else 0.0
+
+    @staticmethod
+    def _memory(backend: str, usage: _Usage, shape: Tuple[int, int]) -> float:
+        cells = shape[0] * shape[1]
+        if backend in ("dense", "float32"):
+            return (8 if backend == "dense" else 4) * cells
+        return cells / 8 + 16 * usage.density * usage.non_binary * cells
+
+    def report(self, brain: Any) -> List[Dict[str, Any]]:
+        """ One row per connectome: its areas, backend, shape, last measurements, predicted costs and migrations. """
+        return [{"from": from_area, "to": to_area,
+                 "backend": backend_name(brain.connectomes[from_area][to_area]),
+                 "shape": brain.connectomes[from_area][to_area].shape,
+                 "density": usage.density, "non_binary": usage.non_binary,
+                 "costs": dict(usage.costs), "migrations": list(usage.migrations)}
+                for (from_area, to_area), usage in self.usage.items()]
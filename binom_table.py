@@ -0,0 +1,99 @@
+""" Precomputed upper tails of the binomial distribution, used for the thresholds in 'Brain.project_into'.
+
+Every projection needs the smallest alpha such that Pr(Bin(total_k, p) <= alpha) >= (effective_n - k) / effective_n.
+Computing it with scipy.stats means importing scipy, which dominates the start-up time of short simulations and of
+worker processes. Instead, the survival function of Bin(total_k, p) is tabulated for common values of p and all
+total_k up to MAX_TOTAL_K, from the median up to where it drops below MIN_TAIL. The table is shipped in
+'binom_table.npy' and memory-mapped on import, so it costs nothing until it is used.
+
+The .npy file holds a single flat float64 array:
+    [len(p_values), max_total_k, *p_values, *starts, *offsets, *tails]
+where, for the i'th p value and total_k = t, row r = i * (max_total_k + 1) + t covers x = starts[r], starts[r] + 1, ...
+with survival values tails[offsets[r]:offsets[r + 1]].
+
+Run this module as a script to regenerate the table (requires scipy).
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "binom_table.npy")
+P_VALUES = (0.01, 0.05)
+MAX_TOTAL_K = 2048
+MIN_TAIL = 1e-12
+
+
+def _load(file_name: str = TABLE_FILE) -> Optional[Tuple[ndarray, ndarray, ndarray, ndarray]]:
+    """ Memory-map the table, returning (p_values, starts, offsets, tails), or None if it is missing. """
+    if not os.path.exists(file_name):
+        return None
+    data = np.load(file_name, mmap_mode='r')
+    num_p, max_total_k = int(data[0]), int(data[1])
+    num_rows = num_p * (max_total_k + 1)
+    p_values = data[2:2 + num_p]
+    starts = data[2 + num_p:2 + num_p + num_rows]
+    offsets = data[2 + num_p + num_rows:2 + num_p + 2 * num_rows + 1]
+    tails = data[2 + num_p + 2 * num_rows + 1:]
+    return p_values, starts, offsets, tails
+
+
+_table = _load()
+
+
+def tail(total_k: int, p: float) -> Optional[Tuple[int, ndarray]]:
+    """ Tabulated upper tail of Bin(total_k, p).
+
+    :return: (x0, sf) such that sf[i] = Pr(Bin(total_k, p) > x0 + i), or None if (total_k, p) is not tabulated.
+    """
+    if _table is None or not 0 < total_k <= MAX_TOTAL_K:
+        return None
+    p_values, starts, offsets, tails = _table
+    matches = np.flatnonzero(p_values == p)
+    if len(matches) == 0:
+        return None
+    row = int(matches[0]) * (MAX_TOTAL_K + 1) + total_k
+    return int(starts[row]), tails[int(offsets[row]):int(offsets[row + 1])]
+
+
+def upper_quantile(tail_probability: float, total_k: int, p: float) -> Optional[int]:
+    """ Smallest alpha such that Pr(Bin(total_k, p) > alpha) <= tail_probability.
+
+    This is binom.ppf(1 - tail_probability, total_k, p), looked up in the table.
+
+    :return: alpha, or None if the query is outside of the table and scipy has to be used instead.
+    """
+    if not MIN_TAIL <= tail_probability <= 0.5:
+        return None
+    found = tail(total_k, p)
+    if found is None:
+        return None
+    x0, sf = found
+    index = int(np.searchsorted(-sf, -tail_probability, side='left'))
+    if index == len(sf):
+        return None
+    return x0 + index
+
+
+def build_table(file_name: str = TABLE_FILE) -> None:
+    """ Compute the table with scipy and save it to 'file_name'. """
+    from scipy.stats import binom
+    starts = []
+    offsets = [0]
+    tails = []
+    for p in P_VALUES:
+        for total_k in range(MAX_TOTAL_K + 1):
+            x0 = int(binom.ppf(0.5, total_k, p)) if total_k > 0 else 0
+            sf = binom.sf(np.arange(x0, total_k + 1), total_k, p)
+            length = min(int(np.searchsorted(-sf, -MIN_TAIL, side='left')) + 1, len(sf))
+            starts.append(x0)
+            tails.append(sf[:length])
+            offsets.append(offsets[-1] + length)
+    header = [len(P_VALUES), MAX_TOTAL_K] + list(P_VALUES)
+    data = np.concatenate([np.array(header + starts + offsets, dtype=float)] + tails)
+    np.save(file_name, data)
+
+
+if __name__ == "__main__":
+    build_table()
@@ -18,18 +18,166 @@ This module contains classes to represent different elements of a brain simulati
         meaning that all neurons that have their original, random connectome weights (0 or 1) are not saved explicitly.
     - Assembly - TODO define and express in code
 """
+import contextlib
+import copy
 import logging
-from typing import List, Mapping, Tuple, Dict, Any
+import threading
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from types import MappingProxyType, SimpleNamespace
+from typing import List, Mapping, Tuple, Dict, Any, Optional, Sequence
 import numpy as np
-import heapq
 from collections import defaultdict
 
 from numpy.core._multiarray_umath import ndarray
-from scipy.stats import binom
-from scipy.stats import truncnorm
 import math
 import random
 
+import binom_table
+from backend_selection import BackendSelector
+from connectome import BACKENDS, ConnectomeSnapshot, DenseConnectome, new_connectome
+
+# If not None, every new Brain reports its operations to this recorder (see 'workload.Recorder').
+active_recorder: Optional[Any] = None
+
+# The ways 'Brain.project_into' can draw the inputs of potential new winners, see 'Brain.candidate_sampling'.
+CANDIDATE_SAMPLING = ("normal", "order_statistics")
+
+# Attributes of a Brain that copies and pickles leave out: the snapshot is published again for the copy, and the
+# locks only exist while 'project_rounds' runs.
+_UNCOPIED = ("_snapshot", "_connectome_locks")
+
+
+def binomial_threshold(tail_probability: float, total_k: int, p: float) -> float:
+    """ Smallest alpha such that Pr(Bin(total_k, p) <= alpha) >= 1 - tail_probability.
+
+    The precomputed table of 'binom_table' is used when it covers the query, so that scipy is only imported
+    (lazily) for uncommon values of total_k and p.
+    """
+    alpha = binom_table.upper_quantile(tail_probability, total_k, p)
+    if alpha is not None:
+        return float(alpha)
+    from scipy.stats import binom
+    return binom.ppf(1.0 - tail_probability, total_k, p)
+
+
+def binomial_upper_quantiles(tail_probabilities: ndarray, total_k: int, p: float) -> ndarray:
+    """ 'binomial_threshold' of each of the given tail probabilities, using the table where it covers them. """
+    quantiles = np.full(len(tail_probabilities), -1.0)
+    found = binom_table.tail(total_k, p)
+    if found is not None:
+        x0, sf = found
+        indices = np.searchsorted(-sf, -tail_probabilities, side='left')
+        covered = (indices < len(sf)) & (tail_probabilities >= binom_table.MIN_TAIL) & (tail_probabilities <= 0.5)
+        quantiles[covered] = x0 + indices[covered]
+    missing = quantiles < 0
+    if missing.any():
+        from scipy.stats import binom
+        quantiles[missing] = binom.isf(tail_probabilities[missing], total_k, p)
+    return quantiles
+
+
+class _GlobalRandom:
+    """ Random numbers from the global generators of 'numpy.random' and 'random', which simulations seed. """
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(np.random, name)
+
+    @staticmethod
+    def sample(population: Sequence[int], n: int) -> List[int]:
+        return random.sample(population, n)
+
+    def bernoulli(self, p: float, from_area: str, to_area: str, rows: range, columns: range) -> ndarray:
+        """ Baseline synapses for the given rows and columns of the connectome from 'from_area' into 'to_area'. """
+        return np.random.binomial(1, p, size=(len(rows), len(columns))).astype(float)
+
+
+class _TaskRandom:
+    """ Random numbers of a single projection of 'Brain.project_rounds', independent of the order of projections.
+
+    Everything is drawn from a generator seeded by (seed, area, round of the area), except baseline synapses: these
+    are a hash of (seed, connectome, row, column), so that a synapse gets the same weight whether it is created by a
+    projection into the source area (appending rows) or into the target area (appending columns).
+    """
+
+    def __init__(self, seed: int, area_index: int, area_round: int):
+        self.seed = seed
+        self._generator = np.random.default_rng([seed, area_index, area_round])
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._generator, name)
+
+    def sample(self, population: Sequence[int], n: int) -> List[int]:
+        return [population[i] for i in self._generator.choice(len(population), n, replace=False)]
+
+    def bernoulli(self, p: float, from_area: str, to_area: str, rows: range, columns: range) -> ndarray:
+        key = np.random.SeedSequence([self.seed, zlib.crc32(from_area.encode()),
+                                      zlib.crc32(to_area.encode())]).generate_state(1, np.uint64)[0]
+        cells = (np.arange(rows.start, rows.stop, dtype=np.uint64)[:, np.newaxis] << np.uint64(32)) | \
+            np.arange(columns.start, columns.stop, dtype=np.uint64)
+        # splitmix64 of the cell index, keyed by the connectome
+        x = (cells ^ key) + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+        return ((x >> np.uint64(11)) * 2.0 ** -53 < p).astype(float)
+
+
+_GLOBAL_RANDOM = _GlobalRandom()
+# The random source of the projection running in the current thread, if it is a task of 'Brain.project_rounds'.
+_task = threading.local()
+
+
+def _random() -> Any:
+    """ The random source for the current projection: a '_TaskRandom' inside 'Brain.project_rounds', the private
+    generator of 'Brain.probe' inside a probe, else global. """
+    return getattr(_task, "random", _GLOBAL_RANDOM)
+
+
+def truncated_normal(a: float, b: float, size: int) -> ndarray:
+    """ Sample 'size' values of the standard normal distribution truncated to [a, b], using only numpy.
+
+    Narrow intervals use a uniform proposal, right tails (a > 0) the exponential proposal of Robert (1995),
+    and anything else plain normal samples, so that the acceptance rate is bounded away from 0 in all cases.
+    """
+    if a >= b:
+        return np.full(size, float(a))
+    rng = _random()
+    samples = np.empty(0)
+    while len(samples) < size:
+        if (b - a) * max(abs(a), abs(b), 1.0) <= 1.0:
+            z = rng.uniform(a, b, size)
+            peak = 0.0 if a <= 0 <= b else min(a * a, b * b)
+            accept = rng.random(size) <= np.exp((peak - z * z) / 2)
+        elif a > 0:
+            rate = (a + math.sqrt(a * a + 4)) / 2
+            z = a + rng.exponential(1.0 / rate, size)
+            accept = (rng.random(size) <= np.exp(-(z - rate) ** 2 / 2)) & (z <= b)
+        else:
+            z = rng.standard_normal(size)
+            accept = (z >= a) & (z <= b)
+        samples = np.concatenate((samples, z[accept]))
+    return samples[:size]
+
+
+def _read_only(array: ndarray) -> ndarray:
+    """ A view of 'array' that cannot be written to. """
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+STATS = ("support_size", "num_first_winners", "overlap", "mean_winner_weight", "assembly_density")
+""" The statistics tracked per round by 'Brain.track_stats':
+    - support_size: as in 'Area.saved_w'
+    - num_first_winners: number of neurons that joined the support, i.e. its growth in this round
+    - overlap: number of winners that were also winners in the previous round
+    - mean_winner_weight: mean weight of the synapses from the winners of the projecting areas into the new winners,
+        after plasticity
+    - assembly_density: fraction of existing synapses from the previous winners to the new winners of an area that
+        projects into itself, which for a stable assembly is the density of the assembly
+"""
+
 
 class Stimulus:
     """ Represents a random stimulus that can be applied to any part of the brain.
@@ -80,20 +228,50 @@ class Area:
         _new_winners: During the projection process, a new set of winners is formed. The winners are only
             updated when the projection ends, so that the newly computed winners won't affect computation
         num_first_winners: should be equal to 'len(_new_winners)'
+        rounds: Number of projections into this area so far.
+        last_won: For each neuron in the support, the round (counted by 'rounds') in which it was last a winner.
+        saved_winners: Read-only (rounds x k) array of the winners after each projection into this area.
+            Neurons that were removed from the support by 'Brain.compact' appear as -1.
+        saved_w: Read-only array of the support size after each projection into this area.
+        stats: If statistics are tracked (see 'Brain.track_stats'), maps each statistic to its value in every round.
+        max_weight: If not None, an upper bound on the weight of any synapse coming into this area, from areas and
+            from stimuli. Without it weights of a stable assembly grow as (1+beta)^t. An entry of the stimulus
+            connectome sums the synapses from one stimulus, so it is bounded by 'max_weight' times their number.
+        normalize: If True, the total incoming weight of each winner from a projecting area is kept unchanged by the
+            plasticity update, that is, potentiating the synapses from the winners is compensated by
+            scaling down all synapses into that neuron. Synapses from stimuli are not normalized: all of them fire
+            together, so keeping their total unchanged would switch their plasticity off.
     """
 
-    def __init__(self, name: str, n: int, k: int, beta: float = 0.05):
+    def __init__(self, name: str, n: int, k: int, beta: float = 0.05,
+                 max_weight: Optional[float] = None, normalize: bool = False):
         self.name = name
         self.n = n
         self.k = k
         self.beta = beta
+        self.max_weight = max_weight
+        self.normalize = normalize
         self.stimulus_beta: Dict[str, float] = {}
         self.area_beta: Dict[str, float] = {}
         self.support_size: int = 0
         self.winners: List[int] = []
         self._new_support_size: int = 0
-        self._new_winners: List[int] = []
+        self._new_winners: List[int] = self.winners
         self.num_first_winners: int = -1
+        self.rounds: int = 0
+        self.last_won: ndarray = np.zeros(0, dtype=int)
+        self._saved_winners: ndarray = np.zeros((0, k), dtype=int)
+        self._saved_w: ndarray = np.zeros(0, dtype=int)
+        self.stats: Optional[Dict[str, List[float]]] = None
+        self._round_stats: Dict[str, float] = {}
+
+    @property
+    def saved_winners(self) -> ndarray:
+        return _read_only(self._saved_winners[:self.rounds])
+
+    @property
+    def saved_w(self) -> ndarray:
+        return _read_only(self._saved_w[:self.rounds])
 
     def update_winners(self) -> None:
         """ This function updates the list of winners for this area after a projection step.
@@ -102,6 +280,79 @@ class Area:
         """
         self.winners = self._new_winners
         self.support_size = self._new_support_size
+        self.rounds += 1
+        self.last_won = np.pad(self.last_won, (0, self.support_size - len(self.last_won)), 'constant')
+        self.last_won[self.winners] = self.rounds
+        if self.rounds > len(self._saved_w):
+            capacity = max(16, 2 * len(self._saved_w))
+            self._saved_winners = np.resize(self._saved_winners, (capacity, self.k))
+            self._saved_w = np.resize(self._saved_w, capacity)
+        self._saved_winners[self.rounds - 1] = self.winners
+        self._saved_w[self.rounds - 1] = self.support_size
+        if self.stats is not None:
+            previous = self._saved_winners[self.rounds - 2] if self.rounds > 1 else []
+            self._round_stats["overlap"] = len(np.intersect1d(previous, self.winners))
+            self._round_stats["support_size"] = self.support_size
+            self._round_stats["num_first_winners"] = self.num_first_winners
+            for key in STATS:
+                self.stats.setdefault(key, []).append(self._round_stats.get(key, math.nan))
+            self._round_stats = {}
+
+    def remap_support(self, keep: ndarray) -> None:
+        """ Drop the support neurons for which 'keep' is False, renumbering the remaining ones in order.
+
+        :param keep: Boolean mask over the current support. Must be True for all current winners.
+        """
+        new_indices = np.cumsum(keep) - 1
+        self.winners = new_indices[self.winners].tolist()
+        self._new_winners = self.winners
+        self.support_size = self._new_support_size = int(keep.sum())
+        self.last_won = self.last_won[keep]
+        # renumbered into a new buffer, so that views returned by 'saved_winners' keep the numbering they had
+        saved_winners = self._saved_winners.copy()
+        history = saved_winners[:self.rounds]
+        known = history >= 0
+        history[known] = np.where(keep, new_indices, -1)[history[known]]
+        self._saved_winners = saved_winners
+
+
+class BrainSnapshot:
+    """ An immutable view of a brain at the end of an operation, published by 'Brain.snapshot'.
+
+    Attributes:
+        epoch: Number of the snapshot; every completed 'add_area', 'project' and round of 'project_rounds' publishes
+            the next.
+        winners: Read-only array of the winners of each area.
+        support_sizes: The support size of each area.
+        num_first_winners: The number of neurons that joined the support of each area in its last projection.
+        rounds: Number of projections into each area.
+    """
+
+    def __init__(self, epoch: int, areas: Mapping[str, Area],
+                 connectomes: Optional[Dict[Tuple[str, str], ConnectomeSnapshot]] = None):
+        self.epoch = epoch
+        self.winners: Mapping[str, ndarray] = MappingProxyType(
+            {name: _read_only(np.array(area.winners, dtype=int)) for name, area in areas.items()})
+        self.support_sizes: Mapping[str, int] = MappingProxyType(
+            {name: area.support_size for name, area in areas.items()})
+        self.num_first_winners: Mapping[str, int] = MappingProxyType(
+            {name: area.num_first_winners for name, area in areas.items()})
+        self.rounds: Mapping[str, int] = MappingProxyType({name: area.rounds for name, area in areas.items()})
+        self._connectomes = connectomes
+
+    def _connectome(self, from_area: str, to_area: str) -> ConnectomeSnapshot:
+        if self._connectomes is None:
+            raise ValueError("Connectomes are only part of snapshots with snapshot_connectomes=True")
+        return self._connectomes[(from_area, to_area)]
+
+    def connectome_view(self, from_area: str, to_area: str) -> ndarray:
+        """ A read-only ndarray of the weights from 'from_area' into 'to_area'. Requires 'snapshot_connectomes'. """
+        return self._connectome(from_area, to_area).view()
+
+    def weight_counts(self, from_area: str, to_area: str) -> Tuple[int, int]:
+        """ The number of synapses from 'from_area' into 'to_area', and how many of them have a weight other than 1
+        (see 'DenseConnectome.count_weights'). Requires 'snapshot_connectomes'. """
+        return self._connectome(from_area, to_area).count_weights()
 
 
 class Brain:
@@ -113,39 +364,118 @@ class Brain:
     Attributes:
         areas: A mapping from area names to Area objects representing them.
         stimuli: A mapping from stimulus names to Stimulus objects representing them.
-        stimuli_connectomes: Maps each pair of (stimulus,area) to the ndarray representing the synaptic weights among
-            stimulus neurons and neurons in the support of area.
-        connectomes: Maps each pair of areas to the ndarray representing the synaptic weights among neurons in
-            the support.
+        stimuli_connectomes: Maps each area to a single 2-D ndarray of shape (number of stimuli, area.support_size).
+            Row 'stimulus_rows[stim]' holds the summed synaptic weights from the neurons of 'stim' into each neuron in
+            the support of the area.
+        stimulus_rows: Maps each stimulus name to its row in every 'stimuli_connectomes' matrix.
+        stimuli_baselines: The entries of 'stimuli_connectomes' as they were drawn, before any plasticity, so that
+            'compact' can tell whether the stimulus weights of a neuron are still at baseline.
+        connectomes: Maps each pair of areas to the connectome (see 'connectome.DenseConnectome') holding the synaptic
+            weights among neurons in the support. It can be indexed like an ndarray.
         p: Probability of connectome (edge) existing between two neurons (vertices)
+        max_idle_rounds: If not None, 'compact' is called with it after every projection, which bounds the support
+            of long simulations.
+        track_stats: Whether areas keep running statistics (see 'STATS') of every round, computed during projection.
+        recorder: If not None, the 'workload.Recorder' this brain reports its operations to.
+        connectome_backend: How the connectomes among areas are stored, one of 'connectome.BACKENDS': "dense" keeps
+            them in memory, "mmap" in memory-mapped files in 'scratch_dir', so that they can outgrow physical memory,
+            "packed" as bits for the 0/1 synapses plus a sparse overlay of the potentiated ones, and "float32" as
+            single precision arrays. With "auto", every connectome starts "dense" and 'backend_selector' migrates it
+            between "dense" and "packed" as its density and use change, without changing the results (see
+            'backend_selection').
+        backend_selector: The 'backend_selection.BackendSelector' of the "auto" backend, None for the others.
+        scratch_dir: Directory for the files of the "mmap" backend; the system's temporary directory if None. That is
+            often a tmpfs, held in memory, so connectomes larger than memory need a directory on a disk.
+        candidate_sampling: How the inputs of neurons outside of the support are simulated, one of
+            'CANDIDATE_SAMPLING': "normal" draws 'k' of them from a normal approximation of the binomial tail above
+            the (n-k)/n quantile (see '_potential_new_winners'), "order_statistics" draws exactly the largest ones,
+            stopping at the first that cannot win (see '_order_statistic_candidates').
+        snapshot_connectomes: Whether the snapshots returned by 'snapshot' include the connectomes among areas. They
+            share the buffers of the brain's connectomes (see 'connectome.ConnectomeSnapshot'): a projection only
+            copies the winner blocks it potentiates (the whole columns of the winners of a normalized area), and
+            only while a snapshot that can see them is alive.
     """
 
-    def __init__(self, p: float):
+    def __init__(self, p: float, max_idle_rounds: Optional[int] = None, track_stats: bool = False,
+                 connectome_backend: str = "dense", scratch_dir: Optional[str] = None,
+                 candidate_sampling: str = "normal", snapshot_connectomes: bool = False):
+        if connectome_backend not in BACKENDS and connectome_backend != "auto":
+            raise ValueError("Unknown connectome backend " + connectome_backend)
+        if candidate_sampling not in CANDIDATE_SAMPLING:
+            raise ValueError("Unknown candidate sampling " + candidate_sampling)
         self.areas: Dict[str, Area] = {}
         self.stimuli: Dict[str, Stimulus] = {}
-        self.stimuli_connectomes: Dict[str, Dict[str, ndarray]] = {}
-        self.connectomes: Dict[str, Dict[str, ndarray]] = {}
+        self.stimuli_connectomes: Dict[str, ndarray] = {}
+        self.stimuli_baselines: Dict[str, ndarray] = {}
+        self.stimulus_rows: Dict[str, int] = {}
+        self.connectomes: Dict[str, Dict[str, DenseConnectome]] = {}
         self.p: float = p
+        self.max_idle_rounds: Optional[int] = max_idle_rounds
+        self.track_stats: bool = track_stats
+        self.connectome_backend: str = connectome_backend
+        self.backend_selector: Optional[BackendSelector] = BackendSelector() if connectome_backend == "auto" else None
+        self.scratch_dir: Optional[str] = scratch_dir
+        self.candidate_sampling: str = candidate_sampling
+        self.snapshot_connectomes: bool = snapshot_connectomes
+        self._connectome_locks: Optional[Dict[Tuple[str, str], threading.Lock]] = None
+        self._snapshot: BrainSnapshot = BrainSnapshot(0, {})
+        self.recorder: Optional[Any] = active_recorder
+        if self.recorder is not None:
+            self.recorder.new_brain(self, {"p": p, "max_idle_rounds": max_idle_rounds, "track_stats": track_stats,
+                                           "connectome_backend": connectome_backend,
+                                           "candidate_sampling": candidate_sampling})
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "Brain":
+        """ Deep copy everything except the recorder, which is shared and told about the copy, and the snapshot,
+        which is published again for the copy. """
+        copied = self.__class__.__new__(self.__class__)
+        memo[id(self)] = copied
+        for key, value in self.__dict__.items():
+            if key not in _UNCOPIED:
+                setattr(copied, key, value if key == "recorder" else copy.deepcopy(value, memo))
+        copied._connectome_locks = None
+        copied._publish(self._snapshot.epoch)
+        if self.recorder is not None:
+            self.recorder.copied(self, copied)
+        return copied
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = {key: value for key, value in self.__dict__.items() if key not in _UNCOPIED}
+        state["_snapshot"] = self._snapshot.epoch
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        epoch = state.pop("_snapshot")
+        self.__dict__.update(state)
+        self._connectome_locks = None
+        self._publish(epoch)
 
     def add_stimulus(self, name: str, k: int) -> None:
         """ Initialize a random stimulus with 'k' neurons firing.
         This stimulus can later be applied to different areas of the brain,
         also updating its outgoing connectomes in the process.
 
-        Connectomes to all areas is initialized as an empty numpy array.
+        A new row is appended to the stimulus connectome of every existing area. Each entry is the number of
+        synapses from the 'k' stimulus neurons into an explicit neuron of the area, i.e. Binomial(k, p).
         For every target area, which are all existing areas, set the plasticity coefficient, beta, to equal that area's beta.
 
         :param name: Name used to refer to stimulus
         :param k: Number of neurons in the stimulus
         """
+        if self.recorder is not None:
+            self.recorder.before(self, "add_stimulus")
         self.stimuli[name]: Stimulus = Stimulus(k)
-        new_connectomes: Dict[str, ndarray] = {}
-        for key in self.areas:
-            new_connectomes[key] = np.empty((0, 0))
-            self.areas[key].stimulus_beta[name] = self.areas[key].beta
-        self.stimuli_connectomes[name] = new_connectomes
+        self.stimulus_rows[name] = len(self.stimulus_rows)
+        for key, area in self.areas.items():
+            new_row = np.random.binomial(k, self.p, size=(1, area.support_size)).astype(float)
+            self.stimuli_connectomes[key] = np.vstack((self.stimuli_connectomes[key], new_row))
+            self.stimuli_baselines[key] = np.vstack((self.stimuli_baselines[key], new_row))
+            area.stimulus_beta[name] = area.beta
+        if self.recorder is not None:
+            self.recorder.record(self, "add_stimulus", name, k)
 
-    def add_area(self, name: str, n: int, k: int, beta: float) -> None:
+    def add_area(self, name: str, n: int, k: int, beta: float,
+                 max_weight: Optional[float] = None, normalize: bool = False) -> None:
         """Add an area to this brain, randomly connected to all other areas and stimulus.
 
         Initialize each synapse weight to have a value of 0 or 1 with probability 'p'.
@@ -159,21 +489,32 @@ class Brain:
         :param beta: plasticity parameter of connectomes coming INTO this area.
                 The plasticity parameter of connectomes FROM this area INTO other areas are decided by
                 the betas of those other areas.
+        :param max_weight: Optional cap on the weight of synapses coming INTO this area from areas and stimuli.
+        :param normalize: Whether to keep the total incoming weight of winners constant under plasticity.
         """
-        self.areas[name] = Area(name, n, k, beta)
+        if self.recorder is not None:
+            self.recorder.before(self, "add_area")
+        self.areas[name] = Area(name, n, k, beta, max_weight, normalize)
+        if self.track_stats:
+            self.areas[name].stats = {}
 
-        for stim_name, stim_connectomes in self.stimuli_connectomes.items():
-            stim_connectomes[name] = np.empty(0)  # TODO: Should this be np.empty((0,0))?
+        self.stimuli_connectomes[name] = np.empty((len(self.stimuli), 0))
+        self.stimuli_baselines[name] = np.empty((len(self.stimuli), 0))
+        for stim_name in self.stimuli:
             self.areas[name].stimulus_beta[stim_name] = beta
 
-        new_connectomes: Dict[str, ndarray] = {}
+        backend = "dense" if self.connectome_backend == "auto" else self.connectome_backend
+        new_connectomes: Dict[str, DenseConnectome] = {}
         for key in self.areas:
-            new_connectomes[key] = np.empty((0, 0))
+            new_connectomes[key] = new_connectome(backend, self.areas[key].n, self.scratch_dir)
             if key != name:
-                self.connectomes[key][name] = np.empty((0, 0))
+                self.connectomes[key][name] = new_connectome(backend, n, self.scratch_dir)
             self.areas[key].area_beta[name] = self.areas[key].beta
             self.areas[name].area_beta[key] = beta
         self.connectomes[name] = new_connectomes
+        self._publish()
+        if self.recorder is not None:
+            self.recorder.record(self, "add_area", name, n, k, beta, max_weight, normalize)
 
     def project(self, stim_to_area: Mapping[str, List[str]],
                 area_to_area: Mapping[str, List[str]]) -> None:
@@ -186,6 +527,174 @@ class Brain:
             Note that an area can also be projected into itself.
             Example: {"A":["A","B"],"C":["C","A"]}
         """
+        stim_in, area_in = self._routing(stim_to_area, area_to_area)
+
+        if self.recorder is not None:
+            self.recorder.before(self, "project")
+
+        # to_update is the set of all areas that receive input, in the (deterministic) order they were added
+        to_update = [name for name in self.areas if name in stim_in or name in area_in]
+
+        for area in to_update:
+            num_first_winners = self.project_into(self.areas[area], stim_in[area], area_in[area])
+            self.areas[area].num_first_winners = num_first_winners
+
+        # once done everything, for each area in to_update: area.update_winners()
+        for area in to_update:
+            self.areas[area].update_winners()
+
+        if self.max_idle_rounds is not None:
+            self.compact(self.max_idle_rounds)
+        if self.backend_selector is not None:
+            self.backend_selector.observe(self, area_in, to_update)
+        self._publish()
+        if self.recorder is not None:
+            self.recorder.record(self, "project", stim_to_area, area_to_area)
+
+    def project_rounds(self, stim_to_area: Mapping[str, List[str]], area_to_area: Mapping[str, List[str]],
+                       rounds: int, seed: int, workers: Optional[int] = None) -> None:
+        """ Repeat the same projection 'rounds' times, overlapping rounds of different areas on a thread pool.
+
+        The result is that of calling 'project' with the same routing 'rounds' times: in every round, each area
+        receives the winners of the previous round of the areas projecting into it. But there is no barrier between
+        rounds. The projection of an area in round t only waits for round t-1 of itself and of the areas projecting
+        into it. So in a feed-forward chain stim -> A -> B -> C, area A can run ahead while C is still computing
+        earlier rounds. Connectomes are locked individually while they are read or grown.
+
+        The random numbers of every projection come from a generator seeded by ('seed', area, round of the area),
+        and the baseline synapses of new neurons are a hash of their position (see '_TaskRandom'), so the result
+        does not depend on the order in which projections run and is the same for any number of 'workers'. It differs
+        from that of 'project', which draws from the global generators. Areas with 'Area.normalize' rescale whole
+        columns, which does not commute with other areas appending rows, and compaction ('max_idle_rounds')
+        renumbers all supports, so in either case the projections run one at a time, in the order of 'project'.
+
+        A snapshot (see 'snapshot') is published as soon as every area has finished a round. Connectomes that areas
+        running ahead are still growing cannot be frozen at an earlier round, so with 'snapshot_connectomes' the
+        projections also run one at a time.
+
+        :param rounds: Number of projections.
+        :param seed: Seed of the random numbers of the projections.
+        :param workers: Number of threads; defaults to the number of areas receiving input.
+        """
+        stim_in, area_in = self._routing(stim_to_area, area_to_area)
+        if self.recorder is not None:
+            self.recorder.before(self, "project_rounds")
+        to_update = [name for name in self.areas if name in stim_in or name in area_in]
+        area_index = {name: i for i, name in enumerate(self.areas)}
+        # history[name][t] are the winners of 'name' after round t - 1 (the current ones for t = 0)
+        history: Dict[str, List[List[int]]] = {name: [area.winners] for name, area in self.areas.items()}
+        # states[name][t] is what the snapshots show of 'name' after round t
+        states: Dict[str, List[SimpleNamespace]] = {name: [] for name in to_update}
+
+        def run(name: str, from_winners: Mapping[str, List[int]]) -> None:
+            area = self.areas[name]
+            _task.random = _TaskRandom(seed, area_index[name], area.rounds)
+            try:
+                area.num_first_winners = self.project_into(area, stim_in[name], area_in[name], from_winners)
+            finally:
+                del _task.random
+            area.update_winners()
+            history[name].append(area.winners)
+            states[name].append(SimpleNamespace(winners=area.winners, support_size=area.support_size,
+                                                num_first_winners=area.num_first_winners, rounds=area.rounds))
+
+        def run_round(name: str, t: int) -> None:
+            run(name, {from_area: history[from_area][min(t, len(history[from_area]) - 1)]
+                       for from_area in area_in[name]})
+
+        def publish_round(t: int) -> None:
+            # the last round is published below, after the backend selector has seen all of them
+            if t < rounds - 1:
+                self._publish(areas={**self.areas, **{name: states[name][t] for name in to_update}})
+
+        sequential = (workers == 1 or self.max_idle_rounds is not None or self.snapshot_connectomes or
+                      any(self.areas[name].normalize for name in to_update))
+        if sequential:
+            for t in range(rounds):
+                current = {name: area.winners for name, area in self.areas.items()}
+                for name in to_update:
+                    run(name, current)
+                if self.max_idle_rounds is not None:
+                    self.compact(self.max_idle_rounds)
+                if t < rounds - 1:
+                    self._publish()
+        else:
+            self._connectome_locks = {(from_area, to_area): threading.Lock()
+                                      for from_area in self.areas for to_area in self.areas}
+            try:
+                self._run_pipelined(to_update, area_in, rounds, run_round, workers or len(to_update), publish_round)
+            finally:
+                self._connectome_locks = None
+        if self.backend_selector is not None:
+            self.backend_selector.observe(self, area_in, to_update, rounds)
+        self._publish()
+        if self.recorder is not None:
+            self.recorder.record(self, "project_rounds", stim_to_area, area_to_area, rounds, seed, workers)
+
+    @staticmethod
+    def _run_pipelined(to_update: List[str], area_in: Mapping[str, List[str]], rounds: int,
+                       run: Any, workers: int, on_round: Any) -> None:
+        """ Run 'run(name, t)' for every area in 'to_update' and round t on a thread pool, each once its round t-1
+        and round t-1 of all the areas in 'area_in[name]' (that are updated) are done. Call 'on_round(t)' in the
+        calling thread, in order, once every area has finished round t. """
+        dependents: Dict[str, List[str]] = {name: [name] for name in to_update}
+        missing: Dict[Tuple[str, int], int] = {}
+        for name in to_update:
+            inputs = {from_area for from_area in area_in[name] if from_area in dependents} - {name}
+            for from_area in inputs:
+                dependents[from_area].append(name)
+            for t in range(1, rounds):
+                missing[(name, t)] = len(inputs) + 1
+        finished = [0] * rounds
+        completed = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            running: Dict[Future, Tuple[str, int]] = {pool.submit(run, name, 0): (name, 0)
+                                                       for name in to_update} if rounds > 0 else {}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, t = running.pop(future)
+                    future.result()
+                    finished[t] += 1
+                    while completed < rounds and finished[completed] == len(to_update):
+                        on_round(completed)
+                        completed += 1
+                    for dependent in dependents[name]:
+                        if t + 1 < rounds:
+                            missing[(dependent, t + 1)] -= 1
+                            if missing[(dependent, t + 1)] == 0:
+                                running[pool.submit(run, dependent, t + 1)] = (dependent, t + 1)
+
+    def snapshot(self) -> BrainSnapshot:
+        """ The state of the brain after its last completed 'add_area', 'project' or round of 'project_rounds'.
+
+        Snapshots are immutable and published by replacing a single reference, so another thread can take and read
+        them while the brain projects, without locking and without seeing a partially updated round. 'project_rounds'
+        publishes every round once all the areas have finished it, even if some of them already run ahead.
+        """
+        return self._snapshot
+
+    def _publish(self, epoch: Optional[int] = None, areas: Optional[Mapping[str, Any]] = None) -> None:
+        """ Replace the snapshot with one of the current state, numbered 'epoch' (by default the next one).
+
+        :param areas: The state of the areas to show, if not the current one (see 'project_rounds').
+        """
+        connectomes = None
+        if self.snapshot_connectomes:
+            connectomes = {(from_area, to_area): connectome.share() for from_area, row in self.connectomes.items()
+                           for to_area, connectome in row.items()}
+        self._snapshot = BrainSnapshot(self._snapshot.epoch + 1 if epoch is None else epoch,
+                                       self.areas if areas is None else areas, connectomes)
+
+    def _locked(self, from_area: str, to_area: str) -> Any:
+        """ The lock of the connectome from 'from_area' into 'to_area' while 'project_rounds' runs in parallel. """
+        if self._connectome_locks is None:
+            return contextlib.nullcontext()
+        return self._connectome_locks[(from_area, to_area)]
+
+    def _routing(self, stim_to_area: Mapping[str, List[str]],
+                 area_to_area: Mapping[str, List[str]]) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        """ Validate the arguments of 'project' and invert them: the input stimuli and input areas of every area. """
         stim_in: defaultdict[str, List[str]] = defaultdict(lambda: [])
         area_in: defaultdict[str, List[str]] = defaultdict(lambda: [])
 
@@ -206,24 +715,165 @@ class Brain:
                 if to_area not in self.areas:
                     raise IndexError(to_area + " not in brain.areas")
                 area_in[to_area].append(from_area)
+        return stim_in, area_in
 
-        # to_update is the set of all areas that receive input
-        to_update = set().union(list(stim_in.keys()), list(area_in.keys()))
+    def probe(self, winners: Mapping[str, Sequence[Sequence[int]]], stim_to_area: Mapping[str, List[str]],
+              area_to_area: Mapping[str, List[str]], rounds: int = 1, seed: Optional[int] = None) -> Dict[str, ndarray]:
+        """ Compute the winners of a batch of projections, without plasticity and without changing the brain.
 
-        for area in to_update:
-            num_first_winners = self.project_into(self.areas[area], stim_in[area], area_in[area])
-            self.areas[area].num_first_winners = num_first_winners
+        Each of the B probes is a projection as in 'project', in which the areas in 'winners' fire the probe's own
+        winner set instead of their current winners (the other areas fire their current winners). For example,
+        pattern completion from B random subsets of the assembly in "A" is
+            b.probe({"A": subsets}, {}, {"A": ["A"]}, rounds=5)
+        The probes are evaluated together, with one product of the stacked winner sets with each connectome (see
+        'DenseConnectome.batch_input_sums') and a batched top-k, so B probes cost about as much as one projection.
 
-        # once done everything, for each area in to_update: area.update_winners()
-        for area in to_update:
-            self.areas[area].update_winners()
+        Plasticity is off (beta is treated as 0) and the support does not grow. A neuron outside the support that
+        wins is labeled 'support_size + j', for the j'th such winner of its probe; the label is only a placeholder,
+        as no synapses are drawn for it. When such neurons fire in a later round (or are passed in 'winners'), their
+        synapses into the support are drawn anew as Bernoulli(p).
+
+        The random numbers of a probe come from a private generator seeded by 'seed', so probing does not change the
+        global generators, and with them the results of later projections.
+
+        :param winners: Maps areas to B winner sets each, as indices into their support.
+        :param stim_to_area: As in 'project'.
+        :param area_to_area: As in 'project'.
+        :param rounds: Number of projections; the winners of each round fire in the next one.
+        :param seed: Seed of the random numbers of the probe; fresh entropy if None.
+        :return: The winners of every area that receives input after the last round, as a (B x k) array.
+        """
+        stim_in, area_in = self._routing(stim_to_area, area_to_area)
+        batch_sizes = {len(sets) for sets in winners.values()}
+        if len(batch_sizes) > 1:
+            raise ValueError("All areas must have the same number of probe winner sets")
+        batch = batch_sizes.pop() if batch_sizes else 1
+        firing: Dict[str, List[ndarray]] = {name: [np.asarray(w, dtype=int) for w in sets]
+                                            for name, sets in winners.items()}
+        to_update = [name for name in self.areas if name in stim_in or name in area_in]
+        probe_winners: Dict[str, ndarray] = {}
+        outer = getattr(_task, "random", None)
+        _task.random = np.random.default_rng(seed)
+        try:
+            for _ in range(rounds):
+                probe_winners = {name: self._probe_into(self.areas[name], stim_in[name], area_in[name], firing, batch)
+                                 for name in to_update}
+                firing.update({name: list(new_winners) for name, new_winners in probe_winners.items()})
+        finally:
+            if outer is None:
+                del _task.random
+            else:
+                _task.random = outer
+        return probe_winners
+
+    def _probe_into(self, area: Area, from_stimuli: List[str], from_areas: List[str],
+                    firing: Mapping[str, List[ndarray]], batch: int) -> ndarray:
+        """ The (batch x k) winners of 'area' in a single round of 'probe'.
 
-    def project_into(self, area: Area, from_stimuli: List[str], from_areas: List[str]) -> int:
+        :param firing: The winner sets of the probes, for the areas that do not fire their current winners.
+        """
+        name: str = area.name
+        stim_rows: List[int] = [self.stimulus_rows[stim] for stim in from_stimuli]
+        inputs = np.tile(self.stimuli_connectomes[name][stim_rows].sum(axis=0), (batch, 1))
+        total_k = np.full(batch, sum(self.stimuli[stim].k for stim in from_stimuli))
+        for from_area in from_areas:
+            support_size = self.areas[from_area].support_size
+            sets = firing.get(from_area, [np.asarray(self.areas[from_area].winners, dtype=int)] * batch)
+            in_support = [s[s < support_size] for s in sets]
+            inputs += self.connectomes[from_area][name].batch_input_sums(in_support)
+            total_k += [len(s) for s in sets]
+            num_implicit = np.array([len(s) - len(t) for s, t in zip(sets, in_support)])
+            if num_implicit.any():
+                inputs += _random().binomial(num_implicit[:, np.newaxis], self.p, size=inputs.shape)
+        candidates = np.zeros((batch, area.k))
+        for value in np.unique(total_k[total_k > 0]):
+            rows = np.flatnonzero(total_k == value)
+            candidates[rows] = self._potential_new_winners(area, int(value), len(rows) * area.k).reshape(-1, area.k)
+        return self._batch_select_winners(np.hstack((inputs, candidates)), area.k, area.support_size)
+
+    @staticmethod
+    def _batch_select_winners(values: ndarray, k: int, support_size: int) -> ndarray:
+        """ The top 'k' of every row of 'values', ordered and labeled as in '_select_winners'.
+
+        The columns after 'support_size' are potential new winners; those that win are relabeled
+        'support_size', 'support_size' + 1, ... in the order they appear in the row's winners.
+        """
+        kth = -np.partition(-values, k - 1, axis=1)[:, k - 1]
+        above = values > kth[:, np.newaxis]
+        tied = values == kth[:, np.newaxis]
+        selected = above | (tied & (np.cumsum(tied, axis=1) <= (k - above.sum(axis=1))[:, np.newaxis]))
+        indices = np.nonzero(selected)[1].reshape(len(values), k)
+        order = np.argsort(-np.take_along_axis(values, indices, axis=1), axis=1, kind='stable')
+        winners = np.take_along_axis(indices, order, axis=1)
+        is_new = winners >= support_size
+        winners[is_new] = support_size + (np.cumsum(is_new, axis=1) - 1)[is_new]
+        return winners
+
+    def compact(self, max_idle_rounds: int, weight_threshold: Optional[float] = None) -> Dict[str, int]:
+        """Return neurons that stopped winning to the implicit (random) part of their area.
+
+        A support neuron is dropped if it has not been a winner in the last 'max_idle_rounds' projections into its
+        area, and none of its synapses to and from explicit neurons of all areas, nor from stimuli, grew by more than
+        a factor of 'weight_threshold' over its initial weight. Its rows and columns are removed from all connectomes
+        and the remaining support is renumbered, including the winners of the area. If it is drawn again it gets
+        fresh random synapses.
+
+        Every support neuron has won at least once, and winning potentiates its synapses from the firing stimuli
+        and areas, and in the next round its synapses to the following winners. So a threshold of 1 (weights exactly
+        at baseline) only drops neurons that won while plasticity was off, which in a recurrent area like that of
+        'project_sim' is none of them. The default drops the neurons that won a single time, which is what keeps
+        the support of long simulations bounded: transient winners are forgotten, assemblies are kept.
+
+        :param max_idle_rounds: Minimal number of rounds since the neuron last won. Must be positive.
+        :param weight_threshold: Largest factor by which a synapse may have grown. Defaults to (1 + beta) of each
+            connectome, i.e. synapses potentiated at most once; 1 only drops neurons whose weights are all at
+            baseline.
+        :return: Number of neurons dropped from each area
+        """
+        if max_idle_rounds < 1:
+            raise ValueError("max_idle_rounds must be positive")
+        keep: Dict[str, ndarray] = {}
+        for name, area in self.areas.items():
+            candidates = np.flatnonzero(area.rounds - area.last_won >= max_idle_rounds)
+            candidates = np.setdiff1d(candidates, area.winners)
+            for stim, row in self.stimulus_rows.items():
+                if len(candidates) == 0:
+                    break
+                threshold = 1 + area.stimulus_beta[stim] if weight_threshold is None else weight_threshold
+                candidates = candidates[self.stimuli_connectomes[name][row, candidates] <=
+                                        threshold * self.stimuli_baselines[name][row, candidates]]
+            for other in self.areas:
+                if len(candidates) == 0:
+                    break
+                threshold = 1 + area.area_beta[other] if weight_threshold is None else weight_threshold
+                candidates = candidates[self.connectomes[other][name].column_max(candidates) <= threshold]
+                threshold = 1 + self.areas[other].area_beta[name] if weight_threshold is None else weight_threshold
+                candidates = candidates[self.connectomes[name][other].row_max(candidates) <= threshold]
+            keep[name] = np.ones(area.support_size, dtype=bool)
+            keep[name][candidates] = False
+
+        dropped: Dict[str, int] = {name: area.support_size - int(keep[name].sum()) for name, area in self.areas.items()}
+        for name, area in self.areas.items():
+            for other in self.areas:
+                if dropped[name] > 0 or dropped[other] > 0:
+                    self.connectomes[name][other].select(keep[name], keep[other])
+        for name, area in self.areas.items():
+            if dropped[name] == 0:
+                continue
+            logging.info("Compacting %d neurons out of the support of %s" % (dropped[name], name))
+            self.stimuli_connectomes[name] = self.stimuli_connectomes[name][:, keep[name]]
+            self.stimuli_baselines[name] = self.stimuli_baselines[name][:, keep[name]]
+            area.remap_support(keep[name])
+        return dropped
+
+    def project_into(self, area: Area, from_stimuli: List[str], from_areas: List[str],
+                     from_winners: Optional[Mapping[str, List[int]]] = None) -> int:
         """Project multiple stimuli and area assemblies into area 'area' at the same time.
 
         :param area: The area projected into
         :param from_stimuli: The stimuli that we will be applying
         :param from_areas: List of separate areas whose assemblies we will project into this area
+        :param from_winners: The winners that fire in each of 'from_areas', if not their current winners
         :return: Returns the number of area neurons that were winners for the first time during this projection
         """
         # projecting everything in from stim_in[area] and area_in[area]
@@ -234,23 +884,12 @@ class Brain:
         # have to wait to replace new_winners
         # TODO Add more documentation to this function which does most of the work
         # TODO Handle case of projecting from an area without previous winners.
-        # TODO: there is a bug when adding a new stimulus later on.
         # TODO: Stimulus is updating to somehow represent >100 neurons.
         logging.info(("Projecting " + ",".join(from_stimuli) + " and " + ",".join(from_areas) + " into " + area.name))
-
-        name: str = area.name
-        prev_winner_inputs: List[float] = [0.] * area.support_size
-        for stim in from_stimuli:
-            stim_inputs = self.stimuli_connectomes[stim][name]
-            for i in range(area.support_size):
-                prev_winner_inputs[i] += stim_inputs[i]
-        for from_area in from_areas:
-            connectome = self.connectomes[from_area][name]
-            for w in self.areas[from_area].winners:
-                for i in range(area.support_size):
-                    prev_winner_inputs[i] += connectome[w][i]
-
-        logging.debug("prev_winner_inputs: %s" % prev_winner_inputs)
+        if from_winners is None:
+            from_winners = {from_area: self.areas[from_area].winners for from_area in from_areas}
+        else:
+            from_winners = {from_area: from_winners[from_area] for from_area in from_areas}
 
         # simulate area.k potential new winners
         total_k: int = 0
@@ -262,16 +901,38 @@ class Brain:
         for from_area in from_areas:
             # if self.areas[from_area].support_size < self.areas[from_area].k:
             #	raise ValueError("Area " + from_area + "does not have enough support.")
-            effective_k = len(self.areas[from_area].winners)
+            effective_k = len(from_winners[from_area])
             total_k += effective_k
             input_sizes.append(effective_k)
 
         logging.debug("total_k = " + str(total_k) + " and input_sizes = " + str(input_sizes))
 
+        support_indices, support_inputs = self._support_inputs(area, from_stimuli, from_winners)
+        logging.debug("prev_winner_inputs: %s", support_inputs)
+
+        if self.candidate_sampling == "order_statistics":
+            potential_new_winners = self._order_statistic_candidates(area, total_k, support_inputs)
+        else:
+            potential_new_winners = self._potential_new_winners(area, total_k)
+        logging.debug("potential_new_winners: %s", potential_new_winners)
+
+        first_winner_inputs = self._select_winners(area, support_indices, support_inputs, potential_new_winners)
+        logging.debug("new_winners: %s", area._new_winners)
+
+        first_winner_to_inputs = self._split_inputs(first_winner_inputs, input_sizes)
+        self._update_connectomes(area, from_stimuli, from_winners, first_winner_to_inputs)
+        return len(first_winner_inputs)
+
+    def _potential_new_winners(self, area: Area, total_k: int, size: Optional[int] = None) -> ndarray:
+        """ Simulate the inputs of the 'area.k' best neurons outside of the support of 'area'.
+
+        :param total_k: Total number of neurons firing into 'area'
+        :param size: Number of inputs to draw, if not 'area.k' (e.g. 'area.k' for each of several probes)
+        """
         effective_n = area.n - area.support_size
         # Threshold for inputs that are above (n-k)/n percentile. alpha is the smallest number such that:
         # 							Pr(Bin(total_k,self.p) <= alpha) >= (effective_n-area.k)/effective_n
-        alpha = binom.ppf((float(effective_n - area.k) / effective_n), total_k, self.p)
+        alpha = binomial_threshold(float(area.k) / effective_n, total_k, self.p)
         logging.debug(("Alpha = " + str(alpha)))
         # use normal approximation, between alpha and total_k, round to integer
         # create k potential_new_winners
@@ -279,104 +940,222 @@ class Brain:
         mu = total_k * self.p
         a = float(alpha - mu) / std
         b = float(total_k - mu) / std  # note that b>=a and corresponds to the maximum value of Bin(total_k,self.p)
-        potential_new_winners = truncnorm.rvs(a, b, scale=std, loc=mu, size=area.k)
-        for i in range(area.k):
-            potential_new_winners[i] = round(potential_new_winners[i])
-        potential_new_winners = potential_new_winners.tolist()
+        return np.round(mu + std * truncated_normal(a, b, area.k if size is None else size))
+
+    def _order_statistic_candidates(self, area: Area, total_k: int, support_inputs: ndarray) -> ndarray:
+        """ Sample exactly, in decreasing order, the inputs of the neurons outside of the support of 'area' that can win.
+
+        The inputs of the effective_n = n - support_size neurons outside of the support are independent
+        Bin(total_k, p), so their largest values are the binomial quantiles of the largest of effective_n uniforms.
+        These are generated from the top down (Renyi's representation): the j'th largest uniform U satisfies
+        log U = -(E_1 / effective_n + E_2 / (effective_n - 1) + ... + E_j / (effective_n - j + 1)), E_i ~ Exp(1).
+        Generation stops at the first input that is not larger than the k'th best input of 'support_inputs' (which
+        wins ties, having the smaller index), or after 'area.k' inputs. Once the assembly is stable this is usually
+        the first one, instead of the 'area.k' inputs of '_potential_new_winners'.
 
-        logging.debug("potential_new_winners: %s" % potential_new_winners)
+        :param total_k: Total number of neurons firing into 'area'
+        :param support_inputs: The inputs of the support neurons that may become winners
+        """
+        effective_n = area.n - area.support_size
+        num_candidates = min(area.k, effective_n)
+        if len(support_inputs) >= area.k:
+            bar = np.partition(support_inputs, len(support_inputs) - area.k)[len(support_inputs) - area.k]
+        else:
+            bar = -math.inf
+        candidates: List[ndarray] = []
+        log_u = 0.0
+        generated = 0
+        chunk = 1
+        while generated < num_candidates and total_k > 0:
+            size = min(chunk, num_candidates - generated)
+            remaining = effective_n - generated - np.arange(size)
+            log_us = log_u - np.cumsum(_random().standard_exponential(size) / remaining)
+            values = binomial_upper_quantiles(-np.expm1(log_us), total_k, self.p)
+            losing = np.flatnonzero(values <= bar)
+            if len(losing) > 0:
+                candidates.append(values[:losing[0]])
+                break
+            candidates.append(values)
+            generated += size
+            log_u = log_us[-1]
+            chunk *= 2
+        return np.concatenate(candidates) if candidates else np.zeros(0)
 
+    def _support_inputs(self, area: Area, from_stimuli: List[str],
+                        from_winners: Mapping[str, List[int]]) -> Tuple[ndarray, ndarray]:
+        """ Sum the inputs from the firing stimuli and area winners into the support of 'area'.
+
+        :param from_winners: The winners of each projecting area
+        :return: The support neurons that may become winners, and their inputs. Here, the whole support.
+        """
+        name: str = area.name
+        stim_rows: List[int] = [self.stimulus_rows[stim] for stim in from_stimuli]
+        inputs: ndarray = self.stimuli_connectomes[name][stim_rows].sum(axis=0)
+        for from_area, winners in from_winners.items():
+            with self._locked(from_area, name):
+                inputs += self.connectomes[from_area][name].input_sums(winners)
+        return np.arange(area.support_size), inputs
+
+    @staticmethod
+    def _select_winners(area: Area, support_indices: ndarray, support_inputs: ndarray,
+                        potential_new_winners: ndarray) -> ndarray:
+        """ Take the 'area.k' top neurons among the given support neurons and the potential new winners.
+
+        Ties are broken in favour of the smaller index, with the potential new winners indexed after the support.
+        Sets 'area._new_winners' and 'area._new_support_size'; new assembly neurons get the next free support indices.
+
+        :return: The inputs of the neurons that are winners for the first time
+        """
         # take max among prev_winner_inputs, potential_new_winners
         # get num_first_winners (think something small)
         # can generate area.new_winners, note the new indices
-        both = prev_winner_inputs + potential_new_winners
-        new_winner_indices = heapq.nlargest(area.k, list(range(len(both))), both.__getitem__)
-        num_first_winners = 0
-        first_winner_inputs = []
-        for i in range(area.k):
-            if new_winner_indices[i] >= area.support_size:  # index in potential_new_winners - a new assembly neuron
-                first_winner_inputs.append(potential_new_winners[new_winner_indices[i] - area.support_size])
-                new_winner_indices[i] = area.support_size + num_first_winners
-                num_first_winners += 1
-        area._new_winners = new_winner_indices  # Note that from here on 'new_winner_indices' is not in use.
+        values = np.concatenate((support_inputs, potential_new_winners))
+        indices = np.concatenate((support_indices, area.support_size + np.arange(len(potential_new_winners))))
+        top = np.lexsort((indices, -values))[:area.k]
+        new_winners = indices[top]
+        is_first = new_winners >= area.support_size  # index in potential_new_winners - a new assembly neuron
+        num_first_winners = int(is_first.sum())
+        new_winners[is_first] = area.support_size + np.arange(num_first_winners)
+        area._new_winners = new_winners.tolist()
         area._new_support_size = area.support_size + num_first_winners
+        return values[top][is_first]
 
-        logging.debug("new_winners: %s" % area._new_winners)
+    @staticmethod
+    def _split_inputs(first_winner_inputs: ndarray, input_sizes: List[int]) -> ndarray:
+        """ Randomly split the input of each first time winner among the stimuli and areas that fired.
 
+        :return: Array whose [i][j] entry is the number of connections from the j'th input to the i'th first winner.
+        """
         # for i in num_first_winners
         # generate where input came from
         # 	1) can sample input from array of size total_k, use ranges
         # 	2) can use stars/stripes method: if m total inputs, sample (m-1) out of total_k
-        first_winner_to_inputs: Dict[int, ndarray] = {}
-        for i in range(num_first_winners):
-            input_indices = random.sample(range(0, total_k), int(first_winner_inputs[i]))
-            inputs: ndarray = np.zeros(len(input_sizes))
-            total_so_far = 0
-            for j in range(len(input_sizes)):
-                # inputs[j] is the randomly generated number of connections from the j'th input to area i.
-                inputs[j] = sum([((total_so_far + input_sizes[j]) > w >= total_so_far) for w in input_indices])
-                total_so_far += input_sizes[j]
-            first_winner_to_inputs[i] = inputs
-            logging.debug("for first_winner #%d with input %s split as so: %s" % (i, first_winner_inputs[i], inputs))
-
-        m = 0
-        # connectome for each stim->area
-        # add num_first_winners cells, sampled input * (1+beta)
-        # for i in repeat_winners, stimulus_inputs[i] *= (1+beta)
-        for stim in from_stimuli:
-            if num_first_winners > 0:
-                self.stimuli_connectomes[stim][name] = np.resize(self.stimuli_connectomes[stim][name],
-                                                                 area.support_size + num_first_winners)
-            for i in range(num_first_winners):
-                self.stimuli_connectomes[stim][name][area.support_size + i] = first_winner_to_inputs[i][m]
-            stim_to_area_beta = area.stimulus_beta[stim]
-            for i in area._new_winners:
-                self.stimuli_connectomes[stim][name][i] *= (1 + stim_to_area_beta)
-            logging.debug("stimulus %s now looks like: %s" % (stim, self.stimuli_connectomes[stim][name]))
-            m += 1
+        bounds = np.cumsum(input_sizes)
+        total_k = int(bounds[-1]) if len(bounds) else 0
+        first_winner_to_inputs = np.zeros((len(first_winner_inputs), len(input_sizes)))
+        for i, first_winner_input in enumerate(first_winner_inputs):
+            input_indices = _random().sample(range(0, total_k), int(first_winner_input))
+            first_winner_to_inputs[i] = np.bincount(np.searchsorted(bounds, input_indices, side='right'),
+                                                    minlength=len(input_sizes))
+            logging.debug("for first_winner #%d with input %s split as so: %s",
+                          i, first_winner_input, first_winner_to_inputs[i])
+        return first_winner_to_inputs
+
+    def _update_connectomes(self, area: Area, from_stimuli: List[str], from_winners: Mapping[str, List[int]],
+                            first_winner_to_inputs: ndarray) -> None:
+        """ Add the first time winners of 'area' to the support and apply plasticity to the synapses into its winners.
+
+        :param from_winners: The winners of each projecting area
+        :param first_winner_to_inputs: The split of the inputs of the first time winners, see '_split_inputs'
+        """
+        name: str = area.name
+        num_first_winners = len(first_winner_to_inputs)
+        new_support = range(area.support_size, area.support_size + num_first_winners)
+        stim_rows: List[int] = [self.stimulus_rows[stim] for stim in from_stimuli]
+        rng = _random()
+
+        # stimulus connectome of area
+        # add num_first_winners columns: sampled input for the firing stimuli, Binomial(k,p) for all the others
+        # for the firing stimuli rows and i in new winners, stimulus_inputs[i] *= (1+beta), as a single operation
+        stim_connectome = self.stimuli_connectomes[name]
+        if num_first_winners > 0:
+            stim_ks = np.array([self.stimuli[stim].k for stim in self.stimulus_rows])
+            new_columns = rng.binomial(stim_ks[:, np.newaxis], self.p,
+                                       size=(len(stim_ks), num_first_winners)).astype(float)
+            new_columns[stim_rows] = first_winner_to_inputs[:, :len(stim_rows)].T
+            stim_connectome = np.hstack((stim_connectome, new_columns))
+            self.stimuli_baselines[name] = np.hstack((self.stimuli_baselines[name], new_columns))
+        if stim_rows:
+            stim_factors = np.array([1 + area.stimulus_beta[stim] for stim in from_stimuli])
+            block = np.ix_(stim_rows, area._new_winners)
+            weights = stim_connectome[block] * stim_factors[:, np.newaxis]
+            if area.max_weight is not None:
+                np.minimum(weights, area.max_weight * self.stimuli_baselines[name][block], out=weights)
+            stim_connectome[block] = weights
+        self.stimuli_connectomes[name] = stim_connectome
+        logging.debug("stimuli connectome of %s now looks like: %s", name, stim_connectome)
 
         # connectome for each in_area->area
-        # add num_first_winners columns
-        # for each i in num_first_winners, fill in (1+beta) for chosen neurons
-        # for each i in repeat_winners, for j in in_area.winners, connectome[j][i] *= (1+beta)
-        for from_area in from_areas:
-            from_area_w = self.areas[from_area].support_size
-            from_area_winners = self.areas[from_area].winners
-            self.connectomes[from_area][name] = np.pad(self.connectomes[from_area][name],
-                                                       ((0, 0), (0, num_first_winners)),
-                                                       'constant', constant_values=0)
-            for i in range(num_first_winners):
-                total_in = first_winner_to_inputs[i][m]
-                sample_indices = random.sample(from_area_winners, int(total_in))
-                for j in range(from_area_w):
-                    if j in sample_indices:
-                        self.connectomes[from_area][name][j][area.support_size + i] = 1
-                    if j not in from_area_winners:
-                        self.connectomes[from_area][name][j][area.support_size + i] = np.random.binomial(1, self.p)
-            area_to_area_beta = area.area_beta[from_area]
-            for i in area._new_winners:
-                for j in from_area_winners:
-                    self.connectomes[from_area][name][j][i] *= (1.0 + area_to_area_beta)
-            logging.debug("Connectome of %s to %s is now %s" % (from_area, name, self.connectomes[from_area][name]))
-            m += 1
+        # add num_first_winners columns: the sampled number of connections from the winners of in_area,
+        # bernoulli with probability p from all other neurons in its support
+        # for i in new winners, j in in_area.winners: connectome[j][i] *= (1+beta), as a single block update
+        weight_sum, weight_count = 0.0, 0
+        for m, (from_area, from_area_winners) in enumerate(from_winners.items(), start=len(from_stimuli)):
+            with self._locked(from_area, name):
+                connectome = self.connectomes[from_area][name]
+                if num_first_winners > 0:
+                    new_columns = rng.bernoulli(self.p, from_area, name, range(len(connectome)), new_support)
+                    new_columns[from_area_winners] = 0
+                    for i in range(num_first_winners):
+                        sample_indices = rng.sample(from_area_winners, int(first_winner_to_inputs[i][m]))
+                        new_columns[sample_indices, i] = 1
+                    connectome.append_columns(new_columns)
+                block = connectome.potentiate(from_area_winners, area._new_winners, area.area_beta[from_area],
+                                              area.max_weight, area.normalize)
+                logging.debug("Connectome of %s to %s is now %s", from_area, name, connectome)
+            if area.stats is not None:
+                weight_sum += block.sum()
+                weight_count += block.size
+                if from_area == name and block.size > 0:
+                    area._round_stats["assembly_density"] = np.count_nonzero(block) / block.size
+        if weight_count > 0:
+            area._round_stats["mean_winner_weight"] = weight_sum / weight_count
 
+        if num_first_winners == 0:
+            return
         # expand connectomes from other areas that did not fire into area
         # also expand connectome for area->other_area
         for other_area in self.areas:
-            if other_area not in from_areas:
-                self.connectomes[other_area][name] = np.pad(self.connectomes[other_area][name],
-                                                            ((0, 0), (0, num_first_winners)), 'constant',
-                                                            constant_values=0)
-                for j in range(self.areas[other_area].support_size):
-                    for i in range(area.support_size, area._new_support_size):
-                        self.connectomes[other_area][name][j][i] = np.random.binomial(1, self.p)
+            if other_area not in from_winners:
+                with self._locked(other_area, name):
+                    connectome = self.connectomes[other_area][name]
+                    connectome.append_columns(rng.bernoulli(self.p, other_area, name, range(len(connectome)),
+                                                            new_support))
             # add num_first_winners rows, all bernoulli with probability p
-            self.connectomes[name][other_area] = np.pad(self.connectomes[name][other_area],
-                                                        ((0, num_first_winners), (0, 0)), 'constant', constant_values=0)
-            columns = len(self.connectomes[name][other_area][0])
-            for i in range(area.support_size, area._new_support_size):
-                for j in range(columns):
-                    self.connectomes[name][other_area][i][j] = np.random.binomial(1, self.p)
-            logging.debug("Connectome of %s to %s is now: %s" % (name, other_area, self.connectomes[name][other_area]))
-
-        return num_first_winners
+            with self._locked(name, other_area):
+                connectome = self.connectomes[name][other_area]
+                connectome.append_rows(rng.bernoulli(self.p, name, other_area, new_support,
+                                                     range(connectome.shape[1])))
+                logging.debug("Connectome of %s to %s is now: %s", name, other_area, connectome)
+
+    def connectome_view(self, from_area: str, to_area: str) -> ndarray:
+        """ A read-only view, without copying, of the connectome from 'from_area' into 'to_area'.
+
+        The view supports the buffer protocol and '__array_interface__', so numpy, pandas, networkx etc. can wrap it
+        without a second copy. It is not updated by later projections that grow the support.
+        """
+        return self.connectomes[from_area][to_area].view()
+
+    def stimuli_connectome_view(self, area: str) -> ndarray:
+        """ A read-only view, without copying, of the stimulus connectome of 'area' (rows as in 'stimulus_rows'). """
+        return _read_only(self.stimuli_connectomes[area])
+
+    def connectome_sparse(self, from_area: str, to_area: str, format: str = "csr") -> Any:
+        """ The connectome from 'from_area' into 'to_area' as a scipy.sparse matrix over the support.
+
+        Only the nonzero synapses (about a 'p' fraction) are copied; the dense connectome is not.
+        """
+        from scipy import sparse
+        connectome = self.connectomes[from_area][to_area]
+        rows, columns, weights = connectome.nonzero()
+        return sparse.coo_matrix((weights, (rows, columns)), shape=connectome.shape).asformat(format)
+
+    def winners_history(self, area: str) -> ndarray:
+        """ A read-only (rounds x k) view of the winners of 'area' after each projection into it.
+
+        Later projections do not change it, and 'compact' renumbers a new copy of the history instead of this one.
+        """
+        return self.areas[area].saved_winners
+
+    def backend_report(self) -> List[Dict[str, Any]]:
+        """ The backend, measured density, predicted costs and migrations of every connectome (see
+        'backend_selection.BackendSelector.report'). Requires connectome_backend="auto". """
+        if self.backend_selector is None:
+            raise ValueError("Connectome backends are only selected with connectome_backend='auto'")
+        return self.backend_selector.report(self)
+
+    def stats(self, area: str) -> Dict[str, ndarray]:
+        """ The statistics of 'area' (see 'STATS'), as arrays over its rounds. Requires 'track_stats'. """
+        if self.areas[area].stats is None:
+            raise ValueError("Statistics are not tracked for area " + area)
+        return {key: np.array(values) for key, values in self.areas[area].stats.items()}
@@ -0,0 +1,597 @@
+""" Storage backends for the synaptic weights between the supports of two areas.
+
+'Brain.connectomes[from_area][to_area]' is a connectome object with a row for every support neuron of 'from_area' and
+a column for every support neuron of 'to_area'. 'Brain.project_into' only needs a few operations on it: summing the
+rows of the winners ('input_sums'), appending columns for first time winners of 'to_area' ('append_columns') and rows
+for those of 'from_area' ('append_rows'), scaling the winner block ('potentiate'), and dropping neurons ('select').
+Each backend implements them for its own layout:
+    - DenseConnectome: an in-memory float64 ndarray.
+    - Float32Connectome: an in-memory float32 ndarray.
+    - MmapConnectome: a float64 array in a memory-mapped scratch file, for connectomes larger than memory.
+    - PackedConnectome: one bit per baseline (0/1) synapse, plus a sparse overlay of potentiated weights.
+
+Indexing a connectome (e.g. 'connectome[i][j]' or 'connectome[winners]') reads from the current weights like an
+ndarray, and 'np.asarray(connectome)' returns them as one.
+
+'share' returns a ConnectomeSnapshot of the current weights for readers in other threads, without copying them.
+"""
+import mmap
+import os
+import tempfile
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+# Upper bound on the memory of the temporary arrays built at once by 'batch_input_sums' and 'MmapConnectome.select'.
+BATCH_BYTES = 1 << 27
+
+
+def potentiate(connectome: ndarray, from_winners: List[int], new_winners: List[int], beta: float,
+               max_weight: Optional[float] = None, normalize: bool = False) -> ndarray:
+    """Apply the plasticity update to the synapses from 'from_winners' into 'new_winners', in place.
+
+    The whole winner block is scaled by (1+beta) at once. If 'max_weight' is set the block is clipped to it,
+    and if 'normalize' is set the columns of the new winners are rescaled so that their total incoming weight
+    is the same as before the update.
+
+    :param connectome: The connectome from the projecting area into the area of 'new_winners'
+    :param from_winners: The winners of the projecting area (rows)
+    :param new_winners: The new winners of the area projected into (columns)
+    :param beta: The plasticity parameter of this connectome
+    :param max_weight: See 'Area.max_weight'
+    :param normalize: See 'Area.normalize'
+    :return: The updated block of synapses from 'from_winners' into 'new_winners'
+    """
+    block = np.ix_(from_winners, new_winners)
+    old_block = connectome[block]
+    new_block = old_block * (1.0 + beta)
+    if max_weight is not None:
+        np.minimum(new_block, max_weight, out=new_block)
+    if normalize:
+        totals = connectome[:, new_winners].sum(axis=0)
+        grown = totals + new_block.sum(axis=0) - old_block.sum(axis=0)
+        connectome[block] = new_block
+        scale = np.divide(totals, grown, out=np.ones_like(totals), where=grown > 0)
+        connectome[:, new_winners] *= scale
+        new_block *= scale
+    else:
+        connectome[block] = new_block
+    return new_block
+
+
+def _read_only(array: ndarray) -> ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class ConnectomeSnapshot:
+    """ The weights of a connectome at the time of 'DenseConnectome.share', sharing its buffers instead of a copy.
+
+    Appending and selecting do not write into the weights a snapshot can see: they write past its shape or into new
+    buffers. Only 'potentiate' overwrites them in place, so before it does, the connectome copies the cells it is about
+    to change (the winner block, or for a normalized area the whole columns of the winners) into its snapshots, and
+    'view' puts them back. Once the connectome has moved to new buffers (the dense backends allocate new arrays when
+    growing), the snapshot is 'detached': nothing writes into its buffers anymore, and if nothing was potentiated in
+    between, 'view' returns them without copying. Otherwise 'view' copies the weights, on the reader's side.
+
+    Attributes:
+        detached: Whether the connectome no longer writes into the buffers of this snapshot.
+    """
+
+    def __init__(self, frozen: "DenseConnectome"):
+        self._frozen = frozen
+        self._patches: List[Tuple[ndarray, ndarray, ndarray]] = []
+        self.detached = False
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._frozen.shape
+
+    def view(self) -> ndarray:
+        """ A read-only ndarray of the weights. """
+        if self.detached and not self._patches:
+            return self._frozen.view()
+        weights = np.array(self._frozen.array)
+        num_rows, num_columns = weights.shape
+        # the cells changed first hold the oldest values, so they are restored last
+        for rows, columns, block in reversed(list(self._patches)):
+            inside_rows, inside_columns = rows < num_rows, columns < num_columns
+            weights[np.ix_(rows[inside_rows], columns[inside_columns])] = block[np.ix_(inside_rows, inside_columns)]
+        return _read_only(weights)
+
+    def count_weights(self, rows: Optional[ndarray] = None) -> Tuple[int, int]:
+        """ See 'DenseConnectome.count_weights'. """
+        return DenseConnectome(self.view()).count_weights(rows)
+
+
+class DenseConnectome:
+    """ A connectome held in an in-memory ndarray.
+
+    Attributes:
+        array: The weights, of shape (support of the source area, support of the target area).
+    """
+
+    def __init__(self, array: Optional[ndarray] = None):
+        self.array: ndarray = np.empty((0, 0)) if array is None else array
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.array.shape
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, index: Any) -> Any:
+        return self.array[index]
+
+    def __array__(self, dtype: Any = None, copy: Any = None) -> ndarray:
+        return np.asarray(self.array, dtype=dtype)
+
+    def __repr__(self) -> str:
+        return "%s(%r)" % (self.__class__.__name__, self.array)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state.pop("_sharers", None)
+        return state
+
+    def view(self) -> ndarray:
+        """ A read-only ndarray of the weights, without copying. """
+        return _read_only(self.array)
+
+    def share(self) -> ConnectomeSnapshot:
+        """ A snapshot of the current weights, sharing the buffers of this connectome (see 'ConnectomeSnapshot'). """
+        frozen = self.__class__.__new__(self.__class__)
+        frozen.__dict__.update(self.__dict__)
+        frozen.__dict__.pop("_sharers", None)
+        snapshot = ConnectomeSnapshot(frozen)
+        self._sharers = self._live_sharers() + [weakref.ref(snapshot)]
+        return snapshot
+
+    def _live_sharers(self) -> List[Any]:
+        return [ref for ref in self.__dict__.get("_sharers", ()) if ref() is not None]
+
+    def _block(self, rows: ndarray, columns: ndarray) -> ndarray:
+        """ A copy of the weights from 'rows' into 'columns'. """
+        return self.array[np.ix_(rows, columns)]
+
+    def _preserve(self, rows: List[int], columns: List[int], normalize: bool) -> None:
+        """ Copy the weights that 'potentiate' is about to overwrite into the snapshots sharing them. """
+        sharers = [ref() for ref in self._live_sharers()]
+        self._sharers = [weakref.ref(sharer) for sharer in sharers if sharer is not None]
+        if not self._sharers:
+            return
+        rows = np.arange(self.shape[0]) if normalize else np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        block = self._block(rows, columns)
+        for sharer in sharers:
+            if sharer is not None:
+                sharer._patches.append((rows, columns, block))
+
+    def _detach(self) -> None:
+        """ Tell the snapshots sharing the buffers that this connectome has moved to new ones. """
+        for ref in self._live_sharers():
+            ref().detached = True
+        self._sharers = []
+
+    def input_sums(self, rows: List[int]) -> ndarray:
+        """ The total weight from the neurons 'rows' into every column. """
+        return self.array[rows].sum(axis=0)
+
+    def batch_input_sums(self, row_sets: List[ndarray]) -> ndarray:
+        """ 'input_sums' of each of the given sets of rows, as a (number of sets x columns) array.
+
+        The sets are stacked into an indicator matrix (of the number of times each row is in each set), which is
+        multiplied with the weights. This reads the weights once for all sets, instead of gathering the rows of every
+        set. The sets are processed in chunks whose indicator matrix takes at most 'BATCH_BYTES'.
+        """
+        num_rows, num_columns = self.shape
+        sums = np.zeros((len(row_sets), num_columns))
+        chunk = max(1, BATCH_BYTES // (8 * max(1, num_rows)))
+        for start in range(0, len(row_sets), chunk):
+            sets = row_sets[start:start + chunk]
+            set_of_row = np.repeat(np.arange(len(sets)), [len(rows) for rows in sets])
+            rows = np.concatenate(sets).astype(int) if sets else np.zeros(0, dtype=int)
+            indicator = np.bincount(set_of_row * num_rows + rows, minlength=len(sets) * num_rows)
+            sums[start:start + len(sets)] = indicator.reshape(len(sets), num_rows).astype(float) @ self.array
+        return sums
+
+    def append_columns(self, columns: ndarray) -> None:
+        """ Add columns (of shape (rows, new columns)) for new support neurons of the target area. """
+        self.array = np.hstack((self.array, columns))
+        self._detach()
+
+    def append_rows(self, rows: ndarray) -> None:
+        """ Add rows (of shape (new rows, columns)) for new support neurons of the source area. """
+        self.array = np.vstack((self.array, rows))
+        self._detach()
+
+    def potentiate(self, from_winners: List[int], new_winners: List[int], beta: float,
+                   max_weight: Optional[float] = None, normalize: bool = False) -> ndarray:
+        """ See 'potentiate'. """
+        self._preserve(from_winners, new_winners, normalize)
+        return potentiate(self.array, from_winners, new_winners, beta, max_weight, normalize)
+
+    def select(self, keep_rows: ndarray, keep_columns: ndarray) -> None:
+        """ Keep only the rows and columns for which the boolean masks are True. """
+        self.array = self.array[np.ix_(keep_rows, keep_columns)]
+        self._detach()
+
+    def row_max(self, rows: ndarray) -> ndarray:
+        """ The maximal weight in each of the given rows. """
+        return self.array[rows].max(axis=1, initial=0.0)
+
+    def column_max(self, columns: ndarray) -> ndarray:
+        """ The maximal weight in each of the given columns. """
+        return self.array[:, columns].max(axis=0, initial=0.0)
+
+    def nonzero(self) -> Tuple[ndarray, ndarray, ndarray]:
+        """ Rows, columns and weights of all existing synapses. """
+        rows, columns = np.nonzero(self.array)
+        return rows, columns, self.array[rows, columns]
+
+    def count_weights(self, rows: Optional[ndarray] = None) -> Tuple[int, int]:
+        """ The number of existing synapses, and how many of them have a weight other than 1, in the given rows (all
+        rows if None). Counting all rows scans the whole connectome. """
+        array = self.array if rows is None else self.array[rows]
+        nonzero = array != 0
+        return int(np.count_nonzero(nonzero)), int(np.count_nonzero(nonzero & (array != 1)))
+
+
+class Float32Connectome(DenseConnectome):
+    """ A connectome held in an in-memory float32 ndarray, half the memory and bandwidth of a float64 one.
+
+    Weights are rounded to float32 (about 7 significant digits) after every update, so results can differ from
+    those of the "dense" backend; input sums are still accumulated in float64.
+    """
+
+    def __init__(self, array: Optional[ndarray] = None):
+        super().__init__(np.empty((0, 0), dtype=np.float32) if array is None else array.astype(np.float32))
+
+    def input_sums(self, rows: List[int]) -> ndarray:
+        return self.array[rows].sum(axis=0, dtype=np.float64)
+
+    def append_columns(self, columns: ndarray) -> None:
+        super().append_columns(columns.astype(np.float32))
+
+    def append_rows(self, rows: ndarray) -> None:
+        super().append_rows(rows.astype(np.float32))
+
+
+class MmapConnectome(DenseConnectome):
+    """ A connectome whose weights live in a memory-mapped file in a scratch directory.
+
+    The file is laid out row-major, so gathering the rows of the winners reads contiguous runs. Each row reserves room
+    for 'column_capacity' columns (by default the size of the target area, which bounds its support), so appending
+    columns writes into the reserved space and appending rows extends the file with 'ftruncate'; neither copies
+    existing weights. Reserved space that was never written is a hole of the sparse file and takes no disk or memory.
+    If the columns outgrow the reserved room anyway, the file is rewritten once with twice the capacity.
+    The operating system's page cache keeps the hot (winner) rows in memory and writes cold ones back to disk.
+
+    The file is unlinked as soon as it is created, so it disappears with the object even if the process crashes.
+
+    The default scratch directory is the system's temporary directory, which on many systems is a tmpfs held in
+    memory (or swap). Connectomes that should not take memory need a 'scratch_dir' on a disk.
+
+    Attributes:
+        scratch_dir: Directory for the backing files.
+        array: A writable ndarray view of the current weights in the mapped file.
+    """
+
+    def __init__(self, scratch_dir: Optional[str] = None, array: Optional[ndarray] = None,
+                 column_capacity: int = 1024):
+        self.scratch_dir = scratch_dir if scratch_dir is not None else tempfile.gettempdir()
+        rows, columns = (0, 0) if array is None else array.shape
+        self._rows = rows
+        self._columns = columns
+        self._open(rows, max(column_capacity, columns))
+        if array is not None:
+            self.array[:] = array
+
+    def _open(self, row_capacity: int, column_capacity: int) -> None:
+        """ Create a new (empty) backing file and map it. """
+        fd, path = tempfile.mkstemp(dir=self.scratch_dir, suffix=".connectome")
+        os.unlink(path)
+        self._file = os.fdopen(fd, "r+b")
+        self._column_capacity = column_capacity
+        self._row_capacity = 0
+        self._map(row_capacity)
+
+    def _map(self, row_capacity: int) -> None:
+        """ Make the file large enough for 'row_capacity' rows and (re)map it. """
+        size = max(row_capacity, 1) * self._column_capacity * 8
+        if size > os.fstat(self._file.fileno()).st_size:
+            os.ftruncate(self._file.fileno(), size)
+        self._row_capacity = row_capacity
+        self._buffer = mmap.mmap(self._file.fileno(), size)
+        full = np.frombuffer(self._buffer, dtype=np.float64, count=max(row_capacity, 1) * self._column_capacity)
+        self._full = full.reshape(max(row_capacity, 1), self._column_capacity)
+        self.array = self._full[:self._rows, :self._columns]
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "MmapConnectome":
+        return MmapConnectome(self.scratch_dir, self.array, self._column_capacity)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"scratch_dir": self.scratch_dir, "array": np.array(self.array),
+                "column_capacity": self._column_capacity}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["scratch_dir"], state["array"], state["column_capacity"])
+
+    def append_columns(self, columns: ndarray) -> None:
+        new_columns = self._columns + columns.shape[1]
+        if new_columns > self._column_capacity:
+            old = np.array(self.array)
+            self._open(self._rows, max(new_columns, 2 * self._column_capacity))
+            self._full[:self._rows, :self._columns] = old
+        self._full[:self._rows, self._columns:new_columns] = columns
+        self._columns = new_columns
+        self.array = self._full[:self._rows, :self._columns]
+
+    def append_rows(self, rows: ndarray) -> None:
+        new_rows = self._rows + rows.shape[0]
+        if new_rows > self._row_capacity:
+            self._map(max(new_rows, self._row_capacity + self._row_capacity // 2))
+        self._full[self._rows:new_rows, :self._columns] = rows
+        self._rows = new_rows
+        self.array = self._full[:self._rows, :self._columns]
+
+    def select(self, keep_rows: ndarray, keep_columns: ndarray) -> None:
+        """ See 'DenseConnectome.select'. The kept weights are copied into a new file a chunk of rows at a time. """
+        old, rows = self.array, np.flatnonzero(keep_rows)
+        self._rows, self._columns = len(rows), int(np.count_nonzero(keep_columns))
+        self._open(self._rows, self._column_capacity)
+        chunk = max(1, BATCH_BYTES // (8 * max(1, old.shape[1])))
+        for start in range(0, self._rows, chunk):
+            chunk_rows = rows[start:start + chunk]
+            self._full[start:start + len(chunk_rows), :self._columns] = old[chunk_rows][:, keep_columns]
+        self._detach()
+
+
+class PackedConnectome(DenseConnectome):
+    """ A connectome stored as bits for the random 0/1 baseline synapses plus a sparse overlay of the other weights.
+
+    Almost all weights are either the initial 0 or 1, or (1+beta)^c for the few synapses among assemblies. The 0/1
+    synapses take one bit each, packed row-major with 'np.packbits' (with spare columns, so appending columns does
+    not copy the rows), which is 64 times less memory than float64. Every other weight is kept in an overlay of
+    sorted int64 keys (row << 32 | column) and their values; its bit is 0. In addition every column has a scale
+    factor, applied to all of its weights, so that normalizing a column (see 'potentiate') does not move the whole
+    column into the overlay.
+
+    'input_sums' unpacks only the winner rows and counts their bits per column. The few columns in which these rows
+    have overlay entries are summed again, row by row as for a dense array, so the sums are exactly those of the
+    "dense" backend. Only normalized columns differ in the last bits, since their weights are scaled as a whole.
+    Reading arbitrary weights ('connectome[...]', 'view', 'nonzero') materializes a dense float64 array, so it is
+    meant for analysis, not for inner loops.
+    """
+
+    def __init__(self, array: Optional[ndarray] = None):
+        rows, columns = (0, 0) if array is None else array.shape
+        self._rows = 0
+        self._columns = columns
+        self._bits = np.zeros((rows, max(8, (columns + 7) // 8)), dtype=np.uint8)
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._values = np.zeros(0)
+        self._scale = np.ones(columns)
+        if array is not None:
+            self.append_rows(array)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._rows, self._columns
+
+    @property
+    def array(self) -> ndarray:
+        """ The weights as a dense float64 array (a copy). """
+        return self._dense_rows(np.arange(self._rows))
+
+    def __getitem__(self, index: Any) -> Any:
+        return self.array[index]
+
+    def __repr__(self) -> str:
+        return "%s(shape=%s, overlay=%d)" % (self.__class__.__name__, self.shape, len(self._keys))
+
+    def view(self) -> ndarray:
+        """ A read-only dense copy of the weights. """
+        view = self.array
+        view.flags.writeable = False
+        return view
+
+    def _block(self, rows: ndarray, columns: ndarray) -> ndarray:
+        return self._dense_columns(columns)[rows]
+
+    def _overlay_of_rows(self, rows: ndarray) -> Tuple[ndarray, ndarray]:
+        """ The positions in the overlay of the entries of the given rows, and the index in 'rows' of each of them. """
+        starts = np.searchsorted(self._keys, rows << 32)
+        lengths = np.searchsorted(self._keys, (rows + 1) << 32) - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return positions, np.repeat(np.arange(len(rows)), lengths)
+
+    def _dense_rows(self, rows: ndarray) -> ndarray:
+        """ The given rows of the weights, as a dense float64 array. """
+        rows = np.asarray(rows, dtype=np.int64)
+        dense = np.unpackbits(self._bits[rows], axis=1, count=self._columns).astype(float)
+        positions, owners = self._overlay_of_rows(rows)
+        dense[owners, self._keys[positions] & 0xFFFFFFFF] = self._values[positions]
+        return dense * self._scale
+
+    def _dense_columns(self, columns: ndarray) -> ndarray:
+        """ The given columns of the weights, as a dense float64 array. """
+        columns = np.asarray(columns, dtype=np.int64)
+        dense = ((self._bits[:self._rows, columns >> 3] >> (7 - (columns & 7)).astype(np.uint8)) & 1).astype(float)
+        overlay_columns = self._keys & 0xFFFFFFFF
+        entries = np.flatnonzero(np.isin(overlay_columns, columns))
+        if len(entries) > 0:
+            order = np.argsort(columns, kind='stable')
+            owners = order[np.searchsorted(columns[order], overlay_columns[entries])]
+            dense[self._keys[entries] >> 32, owners] = self._values[entries]
+        return dense * self._scale[columns]
+
+    def _write(self, rows: ndarray, columns: ndarray, weights: ndarray) -> None:
+        """ Set the given (distinct) weights: 0 and 1 (after the column scale) as bits, all others in the overlay. """
+        raw = weights / self._scale[columns]
+        bytes_, masks = columns >> 3, (0x80 >> (columns & 7)).astype(np.uint8)
+        ones = raw == 1.0
+        np.bitwise_or.at(self._bits, (rows[ones], bytes_[ones]), masks[ones])
+        np.bitwise_and.at(self._bits, (rows[~ones], bytes_[~ones]), ~masks[~ones])
+        keys = (rows.astype(np.int64) << 32) | columns
+        kept = ~np.isin(self._keys, keys)
+        in_overlay = (raw != 0.0) & ~ones
+        self._keys = np.concatenate((self._keys[kept], keys[in_overlay]))
+        self._values = np.concatenate((self._values[kept], raw[in_overlay]))
+        order = np.argsort(self._keys, kind='stable')
+        self._keys, self._values = self._keys[order], self._values[order]
+
+    def input_sums(self, rows: List[int]) -> ndarray:
+        rows = np.asarray(rows, dtype=np.int64)
+        bits = self._bits[rows]
+        sums = np.unpackbits(bits, axis=1, count=self._columns).sum(axis=0, dtype=np.float64)
+        positions, owners = self._overlay_of_rows(rows)
+        if len(positions) > 0:
+            columns, overlay_columns = np.unique(self._keys[positions] & 0xFFFFFFFF, return_inverse=True)
+            block = ((bits[:, columns >> 3] >> (7 - (columns & 7)).astype(np.uint8)) & 1).astype(float)
+            block[owners, overlay_columns] = self._values[positions]
+            sums[columns] = np.cumsum(block, axis=0)[-1]
+        return sums * self._scale
+
+    def batch_input_sums(self, row_sets: List[ndarray]) -> ndarray:
+        """ See 'DenseConnectome.batch_input_sums'; the weights are unpacked in chunks of rows. """
+        set_of_row = np.repeat(np.arange(len(row_sets)), [len(rows) for rows in row_sets])
+        rows = np.concatenate(row_sets).astype(int) if row_sets else np.zeros(0, dtype=int)
+        indicator = np.bincount(set_of_row * self._rows + rows, minlength=len(row_sets) * self._rows)
+        indicator = indicator.reshape(len(row_sets), self._rows).astype(float)
+        sums = np.zeros((len(row_sets), self._columns))
+        chunk = max(1, BATCH_BYTES // (8 * max(1, self._columns)))
+        for start in range(0, self._rows, chunk):
+            chunk_rows = np.arange(start, min(start + chunk, self._rows))
+            sums += indicator[:, chunk_rows] @ self._dense_rows(chunk_rows)
+        return sums
+
+    def append_columns(self, columns: ndarray) -> None:
+        num_new = columns.shape[1]
+        end = self._columns + num_new
+        if (end + 7) // 8 > self._bits.shape[1]:
+            bits = np.zeros((self._bits.shape[0], max((end + 7) // 8, 2 * self._bits.shape[1])), dtype=np.uint8)
+            bits[:, :self._bits.shape[1]] = self._bits
+            self._bits = bits
+        first_byte, last_byte = self._columns // 8, (end + 7) // 8
+        touched = np.unpackbits(self._bits[:self._rows, first_byte:last_byte], axis=1)
+        offset = self._columns - 8 * first_byte
+        touched[:, offset:offset + num_new] = columns == 1.0
+        self._bits[:self._rows, first_byte:last_byte] = np.packbits(touched, axis=1)
+        self._scale = np.concatenate((self._scale, np.ones(num_new)))
+        self._columns = end
+        self._write_others(columns, 0, self._columns - num_new)
+
+    def append_rows(self, rows: ndarray) -> None:
+        num_new = rows.shape[0]
+        end = self._rows + num_new
+        if end > self._bits.shape[0]:
+            bits = np.zeros((max(end, 2 * self._bits.shape[0]), self._bits.shape[1]), dtype=np.uint8)
+            bits[:self._rows] = self._bits[:self._rows]
+            self._bits = bits
+        self._bits[self._rows:end, :(self._columns + 7) // 8] = np.packbits(rows * (1.0 / self._scale) == 1.0,
+                                                                             axis=1)
+        self._rows = end
+        self._write_others(rows, self._rows - num_new, 0)
+
+    def _write_others(self, block: ndarray, row_offset: int, column_offset: int) -> None:
+        """ Put the weights of a newly appended block that are not bits (after scaling) into the overlay. """
+        raw = block / self._scale[column_offset:column_offset + block.shape[1]]
+        rows, columns = np.nonzero((raw != 0.0) & (raw != 1.0))
+        if len(rows) > 0:
+            self._write(rows + row_offset, columns + column_offset, block[rows, columns])
+
+    def potentiate(self, from_winners: List[int], new_winners: List[int], beta: float,
+                   max_weight: Optional[float] = None, normalize: bool = False) -> ndarray:
+        """ See 'potentiate'. Normalization only changes the scale factors of the columns of 'new_winners'. """
+        self._preserve(from_winners, new_winners, normalize)
+        rows = np.asarray(from_winners, dtype=np.int64)
+        columns = np.asarray(new_winners, dtype=np.int64)
+        old_block = self._dense_rows(rows)[:, columns]
+        new_block = old_block * (1.0 + beta)
+        if max_weight is not None:
+            np.minimum(new_block, max_weight, out=new_block)
+        if normalize:
+            totals = self._dense_columns(columns).sum(axis=0)
+            grown = totals + new_block.sum(axis=0) - old_block.sum(axis=0)
+            scale = np.divide(totals, grown, out=np.ones_like(totals), where=grown > 0)
+            self._scale[columns] *= scale
+            new_block *= scale
+        block_rows, block_columns = np.nonzero(old_block)
+        self._write(rows[block_rows], columns[block_columns], new_block[block_rows, block_columns])
+        return new_block
+
+    def select(self, keep_rows: ndarray, keep_columns: ndarray) -> None:
+        bits = np.unpackbits(self._bits[:self._rows][keep_rows], axis=1, count=self._columns)[:, keep_columns]
+        self._rows, self._columns = bits.shape
+        self._bits = np.zeros((self._rows, max(8, (self._columns + 7) // 8)), dtype=np.uint8)
+        self._bits[:, :(self._columns + 7) // 8] = np.packbits(bits, axis=1)
+        rows, columns = self._keys >> 32, self._keys & 0xFFFFFFFF
+        kept = keep_rows[rows] & keep_columns[columns]
+        new_rows, new_columns = np.cumsum(keep_rows) - 1, np.cumsum(keep_columns) - 1
+        self._keys = (new_rows[rows[kept]] << 32) | new_columns[columns[kept]]
+        self._values = self._values[kept]
+        self._scale = self._scale[keep_columns]
+
+    def row_max(self, rows: ndarray) -> ndarray:
+        return self._dense_rows(rows).max(axis=1, initial=0.0)
+
+    def column_max(self, columns: ndarray) -> ndarray:
+        return self._dense_columns(columns).max(axis=0, initial=0.0)
+
+    def nonzero(self) -> Tuple[ndarray, ndarray, ndarray]:
+        dense = self.array
+        rows, columns = np.nonzero(dense)
+        return rows, columns, dense[rows, columns]
+
+    def count_weights(self, rows: Optional[ndarray] = None) -> Tuple[int, int]:
+        """ See 'DenseConnectome.count_weights'; the bits of rescaled columns count as weights other than 1. """
+        if rows is None:
+            bits, overlay = self._bits[:self._rows], len(self._keys)
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            bits, overlay = self._bits[rows], len(self._overlay_of_rows(rows)[0])
+        counts = np.unpackbits(bits, axis=1, count=self._columns).sum(axis=0, dtype=np.int64)
+        ones = int(counts.sum())
+        return ones + overlay, overlay + int(counts[self._scale != 1.0].sum())
+
+
+BACKENDS = ("dense", "float32", "mmap", "packed")
+
+
+def new_connectome(backend: str, target_size: int, scratch_dir: Optional[str] = None) -> DenseConnectome:
+    """ An empty connectome of the given backend (one of 'BACKENDS') into an area of 'target_size' neurons. """
+    if backend == "dense":
+        return DenseConnectome()
+    if backend == "float32":
+        return Float32Connectome()
+    if backend == "mmap":
+        return MmapConnectome(scratch_dir, column_capacity=target_size)
+    if backend == "packed":
+        return PackedConnectome()
+    raise ValueError("Unknown connectome backend " + backend)
+
+
+def convert(connectome: DenseConnectome, backend: str, target_size: int,
+            scratch_dir: Optional[str] = None) -> DenseConnectome:
+    """ A copy of 'connectome' in the given backend. """
+    array = np.asarray(connectome, dtype=float)
+    if backend == "dense":
+        return DenseConnectome(np.array(array))
+    if backend == "float32":
+        return Float32Connectome(array)
+    if backend == "mmap":
+        return MmapConnectome(scratch_dir, array, column_capacity=max(target_size, array.shape[1]))
+    if backend == "packed":
+        return PackedConnectome(array)
+    raise ValueError("Unknown connectome backend " + backend)
+
+
+def backend_name(connectome: DenseConnectome) -> str:
+    """ The name in 'BACKENDS' of the backend of 'connectome'. """
+    return {DenseConnectome: "dense", Float32Connectome: "float32", MmapConnectome: "mmap",
+            PackedConnectome: "packed"}[type(connectome)]
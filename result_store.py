@@ -0,0 +1,164 @@
+""" Appendable, columnar storage for simulation results.
+
+'brain_util.sim_save' pickles a whole result object at once, so nothing can be added to it, queried or partially read.
+A ResultStore is a directory of .npy column chunks plus a JSON manifest:
+
+    <root>/manifest.json
+    <root>/<sim>/<key>/<column>.<chunk>.npy
+
+Results are keyed by the name of the simulation and its parameters (which should include the seed). A sweep can
+'append' rows as they finish, a plot can 'load' only the columns it needs, and 'cached' serves a re-run with
+identical parameters from the store instead of running it again.
+
+Example:
+    store = ResultStore("results")
+    for beta in betas:
+        params = {"n": n, "k": k, "p": p, "beta": beta, "t": t, "seed": seed}
+        store.cached("project_sim", params, lambda: {"support_size": [project_sim(n, k, p, beta, t)]})
+    support_sizes = store.load("project_sim", params, columns=["support_size"])["support_size"]
+"""
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence
+
+import numpy as np
+from numpy import ndarray
+
+
+def _to_json(value: Any) -> Any:
+    """ The JSON form of a parameter value that 'json' cannot encode: numpy values as the equal Python ones. """
+    if isinstance(value, (np.generic, ndarray)):
+        return value.tolist()
+    return str(value)
+
+
+class ResultStore:
+    """ A directory of simulation results, stored column by column.
+
+    Attributes:
+        root: The directory holding the manifest and the column chunks.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(sim: str, params: Mapping[str, Any]) -> str:
+        """ A stable identifier of the results of running 'sim' with 'params'. """
+        text = json.dumps({"sim": sim, "params": params}, sort_keys=True, default=_to_json)
+        return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+    @contextmanager
+    def _manifest(self, write: bool = False) -> Iterator[Dict[str, Any]]:
+        """ Read (and if 'write', rewrite) the manifest while holding a lock on the store. """
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            path = os.path.join(self.root, self.MANIFEST)
+            manifest: Dict[str, Any] = {"entries": {}}
+            if os.path.exists(path):
+                with open(path) as f:
+                    manifest = json.load(f)
+            yield manifest
+            if write:
+                with open(path + ".tmp", "w") as f:
+                    json.dump(manifest, f, indent=1, sort_keys=True)
+                os.replace(path + ".tmp", path)
+
+    def append(self, sim: str, params: Mapping[str, Any], **columns: Any) -> None:
+        """ Append rows to the results of 'sim' with 'params'.
+
+        :param columns: Arrays (or anything np.asarray accepts) with the same length along their first axis.
+            The first append decides the set of columns of this entry; later appends must provide the same ones.
+        """
+        arrays = {name: np.asarray(value) for name, value in columns.items()}
+        lengths = {len(array) for array in arrays.values()}
+        if len(lengths) != 1:
+            raise ValueError("All columns must have the same number of rows")
+        key = self.key(sim, params)
+        with self._manifest(write=True) as manifest:
+            entry = manifest["entries"].setdefault(key, {"sim": sim, "params": json.loads(
+                json.dumps(params, default=_to_json)), "columns": {}, "chunks": 0, "rows": 0, "complete": False})
+            if entry["columns"] and set(entry["columns"]) != set(arrays):
+                raise ValueError("Columns %s do not match the stored columns %s" %
+                                 (sorted(arrays), sorted(entry["columns"])))
+            directory = os.path.join(self.root, sim, key)
+            os.makedirs(directory, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(directory, "%s.%d.npy" % (name, entry["chunks"])), array)
+                entry["columns"][name] = str(array.dtype)
+            entry["chunks"] += 1
+            entry["rows"] += lengths.pop()
+
+    def mark_complete(self, sim: str, params: Mapping[str, Any]) -> None:
+        """ Record that no more rows will be appended for 'sim' with 'params'. """
+        with self._manifest(write=True) as manifest:
+            manifest["entries"][self.key(sim, params)]["complete"] = True
+
+    def remove(self, sim: str, params: Mapping[str, Any]) -> None:
+        """ Delete the results of 'sim' with 'params', if there are any. """
+        key = self.key(sim, params)
+        with self._manifest(write=True) as manifest:
+            entry = manifest["entries"].pop(key, None)
+            if entry is not None:
+                directory = os.path.join(self.root, sim, key)
+                for name in entry["columns"]:
+                    for chunk in range(entry["chunks"]):
+                        os.remove(os.path.join(directory, "%s.%d.npy" % (name, chunk)))
+                os.rmdir(directory)
+
+    def entry(self, sim: str, params: Mapping[str, Any]) -> Optional[Dict[str, Any]]:
+        """ The manifest entry of 'sim' with 'params' (its columns, number of rows, etc.), or None. """
+        with self._manifest() as manifest:
+            return manifest["entries"].get(self.key(sim, params))
+
+    def contains(self, sim: str, params: Mapping[str, Any], complete: bool = True) -> bool:
+        """ Whether results of 'sim' with 'params' are stored (and if 'complete', marked complete). """
+        entry = self.entry(sim, params)
+        return entry is not None and (entry["complete"] or not complete)
+
+    def find(self, sim: str, **params: Any) -> List[Dict[str, Any]]:
+        """ The parameters of all stored runs of 'sim' that agree with the given parameter values. """
+        with self._manifest() as manifest:
+            return [entry["params"] for entry in manifest["entries"].values()
+                    if entry["sim"] == sim and all(entry["params"].get(name) == value
+                                                   for name, value in params.items())]
+
+    def load(self, sim: str, params: Mapping[str, Any], columns: Optional[Sequence[str]] = None,
+             mmap: bool = False) -> Dict[str, ndarray]:
+        """ Read stored results of 'sim' with 'params'.
+
+        :param columns: Names of the columns to read. Defaults to all of them.
+        :param mmap: Memory-map the chunks instead of reading them. Only avoids a copy if there is a single chunk.
+        :return: A mapping from column name to the concatenation of all its chunks.
+        """
+        entry = self.entry(sim, params)
+        if entry is None:
+            raise KeyError("No results for %s with %s" % (sim, params))
+        directory = os.path.join(self.root, sim, self.key(sim, params))
+        result: Dict[str, ndarray] = {}
+        for name in (entry["columns"] if columns is None else columns):
+            if name not in entry["columns"]:
+                raise KeyError("No column %s for %s" % (name, sim))
+            chunks = [np.load(os.path.join(directory, "%s.%d.npy" % (name, chunk)), mmap_mode='r' if mmap else None)
+                      for chunk in range(entry["chunks"])]
+            result[name] = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        return result
+
+    def cached(self, sim: str, params: Mapping[str, Any],
+               run: Callable[[], Mapping[str, Any]]) -> Dict[str, ndarray]:
+        """ Load the results of 'sim' with 'params' if they are complete, otherwise call 'run' and store its columns.
+
+        Since the key only depends on 'params', they must include everything that affects the results, e.g. the seed.
+        Rows of an incomplete (e.g. interrupted) run are discarded before running again.
+        """
+        if not self.contains(sim, params):
+            self.remove(sim, params)
+            self.append(sim, params, **run())
+            self.mark_complete(sim, params)
+        return self.load(sim, params)
@@ -0,0 +1,311 @@
+""" Execution of a single Brain across several worker processes, sharded by neuron ranges.
+
+In a ShardedBrain the support of every area is split into blocks of 'shard_size' consecutive neuron indices, and block
+b is owned by worker b % num_shards. A worker holds, for each neuron it owns, its column in every incoming connectome
+(from all explicit neurons of every area) and in the stimulus connectome of its area. The coordinator (the ShardedBrain
+object itself) only keeps the Area objects.
+
+A projection into an area then works as follows:
+    - every worker sums the inputs into the support neurons it owns and sends back its local top-k,
+    - the coordinator merges them with the simulated potential new winners into the global top-k, exactly as
+      'Brain.project_into' does for the whole support,
+    - the coordinator sends the new winners (and, for first time winners, which firing neurons connect to them) to
+      the workers, which apply plasticity to their columns and grow their connectomes.
+Only winner lists and local top-k candidates go through the pipes, so the cost of a round is dominated by the workers'
+(parallel) work on their own slices.
+
+The 'Brain.project' API is unchanged:
+    with ShardedBrain(p=0.01, num_shards=8) as b:
+        b.add_stimulus("stim", k)
+        b.add_area("A", n, k, beta)
+        b.project({"stim": ["A"]}, {})
+
+Workers draw their random synapses from their own generators, so a sharded run has the same distribution as an
+unsharded one but not the same random stream.
+"""
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from brain import Area, Brain, Stimulus
+from connectome import potentiate
+
+
+class _Shard:
+    """ The slice of a brain owned by one worker process.
+
+    Attributes:
+        owned: For each area, the (sorted) support indices owned by this shard.
+        stimuli_connectomes: For each area, the columns of its stimulus connectome for the owned neurons.
+        stimuli_baselines: The same columns as they were drawn, for the cap of 'Area.max_weight'.
+        connectomes: connectomes[to_area][from_area] holds the columns of the owned neurons of 'to_area', with a row
+            for every support neuron of 'from_area'. Note the reversed order of keys compared to 'Brain.connectomes'.
+    """
+
+    def __init__(self, p: float, seed: Optional[int]):
+        self.p = p
+        self.rng = np.random.default_rng(seed)
+        self.stimuli_k: List[int] = []
+        self.support_size: Dict[str, int] = {}
+        self.owned: Dict[str, ndarray] = {}
+        self.stimuli_connectomes: Dict[str, ndarray] = {}
+        self.stimuli_baselines: Dict[str, ndarray] = {}
+        self.connectomes: Dict[str, Dict[str, ndarray]] = {}
+
+    def add_stimulus(self, k: int) -> None:
+        self.stimuli_k.append(k)
+        for name, connectome in self.stimuli_connectomes.items():
+            new_row = self.rng.binomial(k, self.p, size=(1, len(self.owned[name]))).astype(float)
+            self.stimuli_connectomes[name] = np.vstack((connectome, new_row))
+            self.stimuli_baselines[name] = np.vstack((self.stimuli_baselines[name], new_row))
+
+    def add_area(self, name: str) -> None:
+        self.support_size[name] = 0
+        self.owned[name] = np.zeros(0, dtype=int)
+        self.stimuli_connectomes[name] = np.empty((len(self.stimuli_k), 0))
+        self.stimuli_baselines[name] = np.empty((len(self.stimuli_k), 0))
+        self.connectomes[name] = {}
+        for other in self.connectomes:
+            self.connectomes[name][other] = np.empty((self.support_size[other], 0))
+            self.connectomes[other][name] = np.empty((0, len(self.owned[other])))
+
+    def top_inputs(self, name: str, stim_rows: List[int], from_winners: Dict[str, List[int]],
+                   k: int) -> Tuple[ndarray, ndarray]:
+        """ The (at most) k owned neurons of 'name' with the highest inputs, and their inputs. """
+        inputs = self.stimuli_connectomes[name][stim_rows].sum(axis=0)
+        for from_area, winners in from_winners.items():
+            inputs += self.connectomes[name][from_area][winners].sum(axis=0)
+        top = np.lexsort((self.owned[name], -inputs))[:k]
+        return self.owned[name][top], inputs[top]
+
+    def update(self, name: str, stim_rows: List[int], stim_factors: ndarray, from_winners: Dict[str, List[int]],
+               betas: Dict[str, float], max_weight: Optional[float], normalize: bool, new_winners: ndarray,
+               num_first_winners: int, new_owned: ndarray, new_stim_inputs: ndarray,
+               new_samples: Dict[str, List[List[int]]]) -> None:
+        """ The part of 'Brain._update_connectomes' for the neurons of 'name' owned by this shard.
+
+        :param new_winners: All new winners of 'name' (global support indices)
+        :param num_first_winners: Total number of first time winners of 'name' (over all shards)
+        :param new_owned: The first time winners owned by this shard
+        :param new_stim_inputs: For each owned first time winner, its inputs from the firing stimuli
+        :param new_samples: For each firing area, for each owned first time winner, the winners connected to it
+        """
+        num_new = len(new_owned)
+        owned = np.concatenate((self.owned[name], new_owned)).astype(int)
+        local_winners = np.searchsorted(owned, new_winners[np.isin(new_winners, owned)])
+
+        stim_connectome = self.stimuli_connectomes[name]
+        if num_new > 0:
+            stim_ks = np.array(self.stimuli_k)
+            new_columns = self.rng.binomial(stim_ks[:, np.newaxis], self.p, size=(len(stim_ks), num_new)).astype(float)
+            new_columns[stim_rows] = new_stim_inputs.T
+            stim_connectome = np.hstack((stim_connectome, new_columns))
+            self.stimuli_baselines[name] = np.hstack((self.stimuli_baselines[name], new_columns))
+        if stim_rows:
+            block = np.ix_(stim_rows, local_winners)
+            weights = stim_connectome[block] * stim_factors[:, np.newaxis]
+            if max_weight is not None:
+                np.minimum(weights, max_weight * self.stimuli_baselines[name][block], out=weights)
+            stim_connectome[block] = weights
+        self.stimuli_connectomes[name] = stim_connectome
+
+        for from_area, connectome in self.connectomes[name].items():
+            if num_new > 0:
+                new_columns = self.rng.binomial(1, self.p, size=(len(connectome), num_new)).astype(float)
+                if from_area in from_winners:
+                    new_columns[from_winners[from_area]] = 0
+                    for i, sample_indices in enumerate(new_samples[from_area]):
+                        new_columns[sample_indices, i] = 1
+                connectome = np.hstack((connectome, new_columns))
+            if from_area in from_winners:
+                potentiate(connectome, from_winners[from_area], local_winners, betas[from_area], max_weight, normalize)
+            self.connectomes[name][from_area] = connectome
+
+        self.owned[name] = owned
+        self.support_size[name] += num_first_winners
+        if num_first_winners > 0:
+            for other, incoming in self.connectomes.items():
+                new_rows = self.rng.binomial(1, self.p, size=(num_first_winners, len(self.owned[other])))
+                incoming[name] = np.vstack((incoming[name], new_rows))
+
+    def columns(self, to_area: str, from_area: Optional[str]) -> Tuple[ndarray, ndarray]:
+        """ The owned neurons of 'to_area' and their columns of the connectome from 'from_area' (or the stimuli). """
+        if from_area is None:
+            return self.owned[to_area], self.stimuli_connectomes[to_area]
+        return self.owned[to_area], self.connectomes[to_area][from_area]
+
+
+def _serve_shard(connection: Connection, p: float, seed: Optional[int]) -> None:
+    """ Main loop of a worker process: run the methods of a _Shard as requested by the coordinator. """
+    shard = _Shard(p, seed)
+    while True:
+        request = connection.recv()
+        if request is None:
+            connection.close()
+            return
+        method, args = request
+        try:
+            connection.send((True, getattr(shard, method)(*args)))
+        except Exception as e:
+            connection.send((False, e))
+
+
+class ShardedBrain(Brain):
+    """ A Brain whose connectomes are split by neuron ranges among worker processes.
+
+    'connectomes' and 'stimuli_connectomes' are not kept in this process; use 'connectome' and 'stimuli_connectome'
+    to gather them (e.g. for analysis or tests). Tracked statistics only include those known to the coordinator
+    (support size, first winners and overlap). Other keyword arguments are those of 'Brain', except for the ones that
+    need the connectomes in this process: compaction ('max_idle_rounds'), other connectome backends than "dense",
+    and 'snapshot_connectomes'.
+
+    Attributes:
+        num_shards: Number of worker processes.
+        shard_size: Number of consecutive support indices in a block owned by a single worker.
+    """
+
+    def __init__(self, p: float, num_shards: int = 2, shard_size: int = 1024, seed: Optional[int] = None,
+                 **kwargs: Any):
+        if kwargs.get("max_idle_rounds") is not None:
+            raise ValueError("Compaction (max_idle_rounds) is not supported for a ShardedBrain")
+        if kwargs.get("connectome_backend", "dense") != "dense":
+            raise ValueError("Only the dense connectome backend is supported for a ShardedBrain")
+        if kwargs.get("snapshot_connectomes"):
+            raise ValueError("Snapshots of connectomes are not supported for a ShardedBrain")
+        super().__init__(p, **kwargs)
+        self.num_shards = num_shards
+        self.shard_size = shard_size
+        self._connections: List[Connection] = []
+        self._processes: List[multiprocessing.Process] = []
+        seeds = np.random.SeedSequence(seed).spawn(num_shards)
+        for shard in range(num_shards):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, args=(child, p, seeds[shard]), daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "ShardedBrain":
+        raise NotImplementedError("Copying is not supported for a ShardedBrain")
+
+    def __enter__(self) -> "ShardedBrain":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """ Stop the worker processes. """
+        for connection in self._connections:
+            connection.send(None)
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def _call(self, method: str, per_shard_args: List[Tuple]) -> List[Any]:
+        """ Run '_Shard.method' in all workers in parallel, with the given arguments for each of them. """
+        for connection, args in zip(self._connections, per_shard_args):
+            connection.send((method, args))
+        results = []
+        for connection in self._connections:
+            ok, result = connection.recv()
+            if not ok:
+                raise result
+            results.append(result)
+        return results
+
+    def _broadcast(self, method: str, *args: Any) -> List[Any]:
+        return self._call(method, [args] * self.num_shards)
+
+    def owner(self, indices: ndarray) -> ndarray:
+        """ The shard owning each of the given support indices. """
+        return (np.asarray(indices) // self.shard_size) % self.num_shards
+
+    def add_stimulus(self, name: str, k: int) -> None:
+        if self.recorder is not None:
+            self.recorder.before(self, "add_stimulus")
+        self.stimuli[name] = Stimulus(k)
+        self.stimulus_rows[name] = len(self.stimulus_rows)
+        for area in self.areas.values():
+            area.stimulus_beta[name] = area.beta
+        self._broadcast("add_stimulus", k)
+        if self.recorder is not None:
+            self.recorder.record(self, "add_stimulus", name, k)
+
+    def add_area(self, name: str, n: int, k: int, beta: float,
+                 max_weight: Optional[float] = None, normalize: bool = False) -> None:
+        if self.recorder is not None:
+            self.recorder.before(self, "add_area")
+        self.areas[name] = Area(name, n, k, beta, max_weight, normalize)
+        if self.track_stats:
+            self.areas[name].stats = {}
+        for stim_name in self.stimuli:
+            self.areas[name].stimulus_beta[stim_name] = beta
+        for key in self.areas:
+            self.areas[key].area_beta[name] = self.areas[key].beta
+            self.areas[name].area_beta[key] = beta
+        self._broadcast("add_area", name)
+        self._publish()
+        if self.recorder is not None:
+            self.recorder.record(self, "add_area", name, n, k, beta, max_weight, normalize)
+
+    def compact(self, max_idle_rounds: int, weight_threshold: Optional[float] = None) -> Dict[str, int]:
+        raise NotImplementedError("Compaction is not supported for a ShardedBrain")
+
+    def probe(self, winners: Mapping[str, Sequence[Sequence[int]]], stim_to_area: Mapping[str, List[str]],
+              area_to_area: Mapping[str, List[str]], rounds: int = 1, seed: Optional[int] = None) -> Dict[str, ndarray]:
+        raise NotImplementedError("Probing is not supported for a ShardedBrain")
+
+    def project_rounds(self, stim_to_area: Mapping[str, List[str]], area_to_area: Mapping[str, List[str]],
+                       rounds: int, seed: int, workers: Optional[int] = None) -> None:
+        raise NotImplementedError("Pipelined rounds are not supported for a ShardedBrain; use project")
+
+    def _support_inputs(self, area: Area, from_stimuli: List[str],
+                        from_winners: Mapping[str, List[int]]) -> Tuple[ndarray, ndarray]:
+        stim_rows = [self.stimulus_rows[stim] for stim in from_stimuli]
+        tops = self._broadcast("top_inputs", area.name, stim_rows, from_winners, area.k)
+        return np.concatenate([indices for indices, _ in tops]), np.concatenate([inputs for _, inputs in tops])
+
+    def _update_connectomes(self, area: Area, from_stimuli: List[str], from_winners: Mapping[str, List[int]],
+                            first_winner_to_inputs: ndarray) -> None:
+        num_first_winners = len(first_winner_to_inputs)
+        new_indices = area.support_size + np.arange(num_first_winners)
+        new_owners = self.owner(new_indices)
+        from_areas = list(from_winners)
+        samples = {}
+        for m, from_area in enumerate(from_areas, start=len(from_stimuli)):
+            winners = np.asarray(from_winners[from_area], dtype=int)
+            samples[from_area] = [winners[np.random.choice(len(winners), int(first_winner_to_inputs[i][m]),
+                                                           replace=False)] for i in range(num_first_winners)]
+        stim_rows = [self.stimulus_rows[stim] for stim in from_stimuli]
+        stim_factors = np.array([1 + area.stimulus_beta[stim] for stim in from_stimuli])
+        betas = {from_area: area.area_beta[from_area] for from_area in from_areas}
+        new_winners = np.array(area._new_winners, dtype=int)
+        per_shard_args = []
+        for shard in range(self.num_shards):
+            mine = np.flatnonzero(new_owners == shard)
+            per_shard_args.append((area.name, stim_rows, stim_factors, from_winners, betas, area.max_weight,
+                                   area.normalize, new_winners, num_first_winners, new_indices[mine],
+                                   first_winner_to_inputs[mine, :len(stim_rows)],
+                                   {from_area: [samples[from_area][i] for i in mine] for from_area in from_areas}))
+        self._call("update", per_shard_args)
+
+    def connectome(self, from_area: str, to_area: str) -> ndarray:
+        """ Gather the full connectome from 'from_area' into 'to_area' from the workers. """
+        result = np.zeros((self.areas[from_area].support_size, self.areas[to_area].support_size))
+        for owned, columns in self._broadcast("columns", to_area, from_area):
+            result[:, owned] = columns
+        return result
+
+    def stimuli_connectome(self, to_area: str) -> ndarray:
+        """ Gather the full stimulus connectome of 'to_area' from the workers. """
+        result = np.zeros((len(self.stimuli), self.areas[to_area].support_size))
+        for owned, columns in self._broadcast("columns", to_area, None):
+            result[:, owned] = columns
+        return result
@@ -0,0 +1,334 @@
+""" A local job server that runs brain simulations under a shared memory and core budget.
+
+Clients connect to a Unix socket and send newline-delimited JSON requests. A request
+    {"op": "submit", "spec": {...}}
+runs the simulation described by 'spec' in a worker process, once enough of the configured budget is free, and
+streams back JSON lines: {"event": "queued"}, {"event": "started"}, one {"event": "round", ...} per projection with
+the support size and number of first winners of every area, and finally {"event": "done", "result": {...}}
+(or {"event": "error", "message": ...}). Finished results are cached in a ResultStore, so submitting the same spec
+again is answered from the cache, and a spec that is already running is joined instead of started twice.
+A request {"op": "status"} returns the running and queued jobs and the budget in use.
+
+A spec describes the brain and the projections to run:
+    {"p": 0.01, "seed": 0,
+     "stimuli": [{"name": "stim", "k": 317}],
+     "areas": [{"name": "A", "n": 100000, "k": 317, "beta": 0.05}],
+     "rounds": [{"stim_to_area": {"stim": ["A"]}, "area_to_area": {}},
+                {"stim_to_area": {"stim": ["A"]}, "area_to_area": {"A": ["A"]}, "repeat": 49}]}
+
+Everything runs on the local machine; start a server with
+    python sim_server.py serve --socket /tmp/brain.sock --memory-gb 64 --cores 8
+and submit from Python with 'submit' (an async generator of the streamed events) or 'run_remote'.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping, Optional
+
+import numpy as np
+
+from result_store import ResultStore
+
+DEFAULT_SOCKET = "/tmp/brain_sim.sock"
+STREAM_LIMIT = 1 << 26
+
+
+def validate_spec(spec: Any) -> None:
+    """ Raise ValueError, with a message for the client, if 'spec' does not have the structure described above. """
+
+    def check(condition: bool, message: str) -> None:
+        if not condition:
+            raise ValueError("invalid spec: " + message)
+
+    def entries(value: Any, what: str, fields: Mapping[str, Any]) -> None:
+        check(isinstance(value, list), "%s must be a list" % what)
+        for entry in value:
+            check(isinstance(entry, dict), "every entry of %s must be an object" % what)
+            for field, types in fields.items():
+                check(isinstance(entry.get(field), types) and not isinstance(entry.get(field), bool),
+                      "every entry of %s needs a field %s" % (what, field))
+
+    check(isinstance(spec, dict), "must be an object")
+    check(isinstance(spec.get("p"), (int, float)), "needs a number p")
+    entries(spec.get("stimuli", []), "stimuli", {"name": str, "k": int})
+    entries(spec.get("areas"), "areas", {"name": str, "n": int, "k": int, "beta": (int, float)})
+    entries(spec.get("rounds"), "rounds", {})
+    for projection in spec["rounds"]:
+        check(isinstance(projection.get("repeat", 1), int) and projection.get("repeat", 1) >= 0,
+              "repeat must be a non-negative integer")
+        for routing in ("stim_to_area", "area_to_area"):
+            check(isinstance(projection.get(routing, {}), dict), "%s must be an object" % routing)
+
+
+def estimate_memory(spec: Mapping[str, Any]) -> int:
+    """ An upper bound on the bytes of connectome data a spec can allocate.
+
+    An area's support grows by at most k neurons per projection into it (and never beyond n), and every pair of areas
+    has a dense float64 connectome over their supports.
+    """
+    rounds = sum(r.get("repeat", 1) for r in spec["rounds"])
+    support = {area["name"]: min(area["n"], area["k"] * rounds) for area in spec["areas"]}
+    total = sum(support.values()) ** 2 + len(spec.get("stimuli", [])) * sum(support.values())
+    return 8 * total
+
+
+def run_spec(spec: Mapping[str, Any], on_round: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """ Run the simulation described by 'spec' in this process.
+
+    :param on_round: Called after every projection with the statistics of that round.
+    :return: The final winners and per-round statistics of every area.
+    """
+    import brain
+    random.seed(spec.get("seed"))
+    np.random.seed(spec.get("seed"))
+    b = brain.Brain(spec["p"])
+    for stimulus in spec.get("stimuli", []):
+        b.add_stimulus(stimulus["name"], stimulus["k"])
+    for area in spec["areas"]:
+        b.add_area(area["name"], area["n"], area["k"], area["beta"])
+    history: Dict[str, List[List[int]]] = {name: [] for name in b.areas}
+    round_number = 0
+    for projection in spec["rounds"]:
+        for _ in range(projection.get("repeat", 1)):
+            b.project(projection.get("stim_to_area", {}), projection.get("area_to_area", {}))
+            stats = {name: {"support_size": area.support_size, "num_first_winners": area.num_first_winners}
+                     for name, area in b.areas.items()}
+            for name, area in b.areas.items():
+                history[name].append([area.support_size, area.num_first_winners])
+            on_round({"event": "round", "round": round_number, "areas": stats})
+            round_number += 1
+    return {"winners": {name: list(map(int, area.winners)) for name, area in b.areas.items()},
+            "history": history}
+
+
+def _worker() -> None:
+    """ Entry point of a worker process: read a spec from stdin, stream events to stdout. """
+    spec = json.loads(sys.stdin.readline())
+
+    def emit(event: Dict[str, Any]) -> None:
+        sys.stdout.write(json.dumps(event) + "\n")
+        sys.stdout.flush()
+
+    emit({"event": "done", "result": run_spec(spec, emit)})
+
+
+class _Job:
+    """ A submitted spec: its events so far, and the queues of the clients following it. """
+
+    def __init__(self, key: str, spec: Mapping[str, Any], memory: int):
+        self.key = key
+        self.spec = spec
+        self.memory = memory
+        self.state = "queued"
+        self.events: List[Dict[str, Any]] = []
+        self.followers: List[asyncio.Queue] = []
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+        for queue in self.followers:
+            queue.put_nowait(event)
+
+    def follow(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        self.followers.append(queue)
+        return queue
+
+
+class SimServer:
+    """ Schedules simulation specs onto worker processes within a memory and core budget.
+
+    Attributes:
+        socket_path: The Unix socket clients connect to.
+        memory_budget: Total estimated bytes (see 'estimate_memory') that running jobs may use.
+        cores: Maximal number of jobs running at the same time; each worker uses a single thread.
+        store: Where finished results are cached.
+    """
+
+    def __init__(self, socket_path: str, memory_budget: int, cores: int, store: ResultStore):
+        self.socket_path = socket_path
+        self.memory_budget = memory_budget
+        self.cores = cores
+        self.store = store
+        self._jobs: Dict[str, _Job] = {}
+        self._memory_in_use = 0
+        self._running = 0
+        self._budget: Optional[asyncio.Condition] = None
+
+    async def serve_forever(self) -> None:
+        self._budget = asyncio.Condition()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=STREAM_LIMIT)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                if request.get("op") == "status":
+                    await self._send(writer, self.status())
+                elif request.get("op") == "submit":
+                    async for event in self.submit(request.get("spec")):
+                        await self._send(writer, event)
+                else:
+                    await self._send(writer, {"event": "error", "message": "unknown op %s" % request.get("op")})
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+
+    def status(self) -> Dict[str, Any]:
+        return {"event": "status", "memory_in_use": self._memory_in_use, "memory_budget": self.memory_budget,
+                "running": self._running, "cores": self.cores,
+                "jobs": {key: job.state for key, job in self._jobs.items()}}
+
+    async def submit(self, spec: Mapping[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """ Run (or join, or load from the cache) a spec, yielding its events until it is done. """
+        try:
+            validate_spec(spec)
+        except ValueError as e:
+            yield {"event": "error", "message": str(e)}
+            return
+        # the store takes a file lock, which another process (e.g. a sweep) may hold, so it is used from a thread
+        if await asyncio.to_thread(self.store.contains, "sim_server", spec):
+            stored = await asyncio.to_thread(self.store.load, "sim_server", spec)
+            yield {"event": "done", "cached": True, "result": json.loads(str(stored["result"][0]))}
+            return
+        key = self.store.key("sim_server", spec)
+        job = self._jobs.get(key)
+        if job is None:
+            memory = estimate_memory(spec)
+            if memory > self.memory_budget:
+                yield {"event": "error", "message": "spec needs up to %d bytes, more than the budget of %d" %
+                                                    (memory, self.memory_budget)}
+                return
+            job = self._jobs[key] = _Job(key, spec, memory)
+            job.publish({"event": "queued", "memory": memory})
+            asyncio.ensure_future(self._run(job))
+        queue = job.follow()
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event["event"] in ("done", "error"):
+                    return
+        finally:
+            job.followers.remove(queue)
+
+    async def _run(self, job: _Job) -> None:
+        async with self._budget:
+            await self._budget.wait_for(lambda: self._running < self.cores and
+                                        self._memory_in_use + job.memory <= self.memory_budget)
+            self._running += 1
+            self._memory_in_use += job.memory
+        job.state = "running"
+        job.publish({"event": "started"})
+        env = dict(os.environ, OMP_NUM_THREADS="1", OPENBLAS_NUM_THREADS="1", MKL_NUM_THREADS="1")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), "worker", stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env, limit=STREAM_LIMIT,
+                cwd=os.path.dirname(os.path.abspath(__file__)))
+            process.stdin.write((json.dumps(job.spec) + "\n").encode())
+            await process.stdin.drain()
+            process.stdin.close()
+            # drain stderr while reading stdout, so that a worker logging a lot cannot block on a full pipe
+            stderr_reader = asyncio.ensure_future(process.stderr.read())
+            done: Optional[Dict[str, Any]] = None
+            async for line in process.stdout:
+                event = json.loads(line)
+                if event["event"] == "done":
+                    done = event
+                else:
+                    job.publish(event)
+            stderr = await stderr_reader
+            await process.wait()
+            if done is None:
+                job.publish({"event": "error", "message": stderr.decode()[-2000:]})
+            else:
+                await asyncio.to_thread(self._store, job.spec, done["result"])
+                job.publish(dict(done, cached=False))
+        except Exception as e:
+            job.publish({"event": "error", "message": repr(e)})
+        finally:
+            del self._jobs[job.key]
+            async with self._budget:
+                self._running -= 1
+                self._memory_in_use -= job.memory
+                self._budget.notify_all()
+
+
+    def _store(self, spec: Mapping[str, Any], result: Dict[str, Any]) -> None:
+        """ Cache the result of a finished spec. """
+        self.store.append("sim_server", spec, result=[json.dumps(result)])
+        self.store.mark_complete("sim_server", spec)
+
+
+async def submit(spec: Mapping[str, Any], socket_path: str = DEFAULT_SOCKET) -> AsyncIterator[Dict[str, Any]]:
+    """ Submit a spec to a running server and yield the events streamed back. """
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=STREAM_LIMIT)
+    try:
+        writer.write((json.dumps({"op": "submit", "spec": spec}) + "\n").encode())
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("server closed the connection")
+            event = json.loads(line)
+            yield event
+            if event["event"] in ("done", "error"):
+                return
+    finally:
+        writer.close()
+
+
+def run_remote(spec: Mapping[str, Any], socket_path: str = DEFAULT_SOCKET,
+               on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """ Blocking version of 'submit', returning the result of the spec. """
+
+    async def collect() -> Dict[str, Any]:
+        async for event in submit(spec, socket_path):
+            if on_event is not None:
+                on_event(event)
+            if event["event"] == "error":
+                raise RuntimeError(event["message"])
+            if event["event"] == "done":
+                return event["result"]
+        raise ConnectionError("server closed the connection")
+
+    return asyncio.run(collect())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve")
+    serve.add_argument("--socket", default=DEFAULT_SOCKET)
+    serve.add_argument("--memory-gb", type=float, default=8.0)
+    serve.add_argument("--cores", type=int, default=os.cpu_count())
+    serve.add_argument("--store", default="sim_results")
+    subparsers.add_parser("worker")
+    args = parser.parse_args()
+    if args.command == "worker":
+        _worker()
+    else:
+        server = SimServer(args.socket, int(args.memory_gb * 2 ** 30), args.cores, ResultStore(args.store))
+        asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
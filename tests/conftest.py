@@ -0,0 +1,28 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brain  # noqa: E402
+
+
+@pytest.fixture
+def seeded_brain():
+    """ Builds a brain after seeding the global random generators:
+    seeded_brain(p, {stimulus: k}, {area: (n, k, beta) or (n, k, beta, add_area options)}, seed=0, **Brain options).
+    """
+    def build(p, stimuli, areas, seed=0, **kwargs):
+        random.seed(seed)
+        np.random.seed(seed)
+        b = brain.Brain(p, **kwargs)
+        for name, k in stimuli.items():
+            b.add_stimulus(name, k)
+        for name, (n, k, beta, *options) in areas.items():
+            b.add_area(name, n, k, beta, **(options[0] if options else {}))
+        return b
+
+    return build
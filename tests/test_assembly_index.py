@@ -0,0 +1,33 @@
+import numpy as np
+
+import brain_util as bu
+from assembly_index import AssemblyIndex
+
+
+def test_dropped_neurons_are_ignored():
+    index = AssemblyIndex()
+    index.register("A", "x", [3, 4, 5])
+    index.register("A", "y", [-1, 5, 6])
+    assert index.overlaps("A", [-1, 3, 4]) == {"x": 2}
+    assert index.top("A", [-1, 5, 6], fraction=True) == [("y", 1.0)]
+
+
+def test_queries_match_brain_util_overlap():
+    rng = np.random.default_rng(0)
+    index = AssemblyIndex()
+    assemblies = {"a%d" % i: rng.choice(300, size=rng.integers(1, 40), replace=False).tolist() for i in range(60)}
+    for name, winners in assemblies.items():
+        index.register("A", name, winners)
+    names = list(assemblies)
+    for _ in range(50):
+        winners = rng.choice(300, size=30, replace=False).tolist()
+        counts = {name: bu.overlap(winners, members) for name, members in assemblies.items()}
+        assert index.overlaps("A", winners) == {name: c for name, c in counts.items() if c > 0}
+        for fraction in (False, True):
+            scores = {name: c / len(set(assemblies[name])) if fraction else c for name, c in counts.items() if c > 0}
+            expected = sorted(scores, key=lambda name: (-scores[name], names.index(name)))
+            for m in (1, 5, 100):
+                assert index.top("A", winners, m, fraction) == [(name, scores[name]) for name in expected[:m]]
+            assert index.best_match("A", winners, fraction) == (expected[0], scores[expected[0]])
+    assert index.best_match("A", [1000, 1001]) is None
+    assert index.top("B", [1]) == []
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from backend_selection import BackendSelector
+
+
+def _run(seeded_brain, backend):
+    b = seeded_brain(0.01, {"s": 100}, {"A": (20000, 100, 0.05), "B": (20000, 100, 0.05, {"normalize": True})},
+                     connectome_backend=backend)
+    b.project({"s": ["A"]}, {})
+    for _ in range(15):
+        b.project({"s": ["A"]}, {"A": ["A", "B"], "B": ["B"]})
+    return b
+
+
+def test_auto_backends_do_not_change_results(seeded_brain):
+    dense, auto = _run(seeded_brain, "dense"), _run(seeded_brain, "auto")
+    report = {(row["from"], row["to"]): row for row in auto.backend_report()}
+    assert any(row["migrations"] for row in report.values())
+    assert all(row["backend"] == "dense" for (_, to_area), row in report.items() if to_area == "B")
+    for x in "AB":
+        assert np.array_equal(dense.winners_history(x), auto.winners_history(x))
+        for y in "AB":
+            assert np.array_equal(dense.connectome_view(x, y), auto.connectome_view(x, y))
+
+
+def test_composition_estimates_match_a_full_count(seeded_brain):
+    b = _run(seeded_brain, "dense")
+    selector = BackendSelector(sample_rows=128)
+    for x in "AB":
+        for y in "AB":
+            connectome = b.connectomes[x][y]
+            density, non_binary = selector._composition(connectome, b.areas[x].winners)
+            nonzero, expected_non_binary = connectome.count_weights()
+            assert density == pytest.approx(nonzero / np.prod(connectome.shape), rel=0.1)
+            assert non_binary == pytest.approx(expected_non_binary / nonzero, abs=0.05)
+
+
+def test_report_requires_auto(seeded_brain):
+    with pytest.raises(ValueError):
+        _run(seeded_brain, "dense").backend_report()
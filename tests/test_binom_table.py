@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import binom_table
+import brain
+
+
+def test_import_does_not_load_scipy():
+    code = "import sys, brain; assert not any(m == 'scipy' or m.startswith('scipy.') for m in sys.modules)"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(binom_table.TABLE_FILE))
+
+
+@pytest.mark.parametrize("p", binom_table.P_VALUES)
+def test_table_matches_scipy(p):
+    stats = pytest.importorskip("scipy.stats")
+    rng = np.random.default_rng(0)
+    tail_probabilities = np.concatenate((10.0 ** -rng.uniform(1, 11, size=40), [0.5, 1e-3, 1e-6]))
+    for total_k in (1, 7, 100, 317, 1000, 2048):
+        for q in tail_probabilities:
+            alpha = binom_table.upper_quantile(q, total_k, p)
+            assert alpha is not None
+            assert alpha == stats.binom.ppf(1.0 - q, total_k, p)
+        assert np.array_equal(brain.binomial_upper_quantiles(tail_probabilities, total_k, p),
+                              stats.binom.isf(tail_probabilities, total_k, p))
+
+
+def test_queries_outside_the_table_fall_back_to_scipy():
+    stats = pytest.importorskip("scipy.stats")
+    assert binom_table.upper_quantile(0.01, 5000, 0.05) is None
+    assert binom_table.upper_quantile(0.01, 100, 0.02) is None
+    assert brain.binomial_threshold(0.01, 100, 0.02) == stats.binom.ppf(0.99, 100, 0.02)
+    assert brain.binomial_threshold(1e-15, 100, 0.05) == stats.binom.ppf(1 - 1e-15, 100, 0.05)
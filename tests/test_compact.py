@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def _project_sim(seeded_brain, max_idle_rounds, rounds=40):
+    b = seeded_brain(0.05, {"stim": 100}, {"A": (10000, 100, 0.05)}, max_idle_rounds=max_idle_rounds)
+    b.project({"stim": ["A"]}, {})
+    sizes = []
+    for _ in range(rounds):
+        b.project({"stim": ["A"]}, {"A": ["A"]})
+        sizes.append(b.areas["A"].support_size)
+    return b, sizes
+
+
+def test_compaction_bounds_support(seeded_brain):
+    _, unbounded = _project_sim(seeded_brain, None)
+    b, bounded = _project_sim(seeded_brain, 2)
+    assert max(bounded) < unbounded[-1]
+    assert len(set(bounded[-10:])) == 1
+    assert b.connectomes["A"]["A"].shape == (bounded[-1], bounded[-1])
+    assert b.stimuli_connectomes["A"].shape == b.stimuli_baselines["A"].shape == (1, bounded[-1])
+    winners = b.winners_history("A")
+    assert winners.max() < bounded[-1]
+
+
+def test_compaction_keeps_potentiated_stimulus_weights(seeded_brain):
+    b = seeded_brain(0.05, {"stim": 100, "other": 100}, {"A": (10000, 100, 0.05)})
+    b.project({"stim": ["A"]}, {})
+    for _ in range(3):
+        b.project({"other": ["A"]}, {})
+    history = b.winners_history("A")
+    # neurons that only won in the first round: their synapses among areas were never potentiated
+    only_first = np.setdiff1d(history[0], history[1:])
+    assert len(only_first) > 0
+    assert b.compact(1, weight_threshold=1.0)["A"] == 0
+    row = b.stimulus_rows["stim"]
+    b.stimuli_connectomes["A"][row] = b.stimuli_baselines["A"][row]
+    assert b.compact(1, weight_threshold=1.0)["A"] == len(only_first)
@@ -0,0 +1,63 @@
+import copy
+import pickle
+import numpy as np
+import pytest
+
+import connectome as connectome_module
+from connectome import DenseConnectome, MmapConnectome, PackedConnectome
+
+
+def _run(seeded_brain, **kwargs):
+    b = seeded_brain(0.05, {"s": 40, "t": 30}, {"A": (5000, 40, 0.5), "B": (3000, 40, 0.5, {"max_weight": 2})},
+                     seed=1, track_stats=True, **kwargs)
+    b.project({"s": ["A"]}, {})
+    for _ in range(10):
+        b.project({"s": ["A"], "t": ["B"]}, {"A": ["A", "B"], "B": ["A"]})
+    b.compact(2)
+    for _ in range(5):
+        b.project({"t": ["A"]}, {"A": ["A", "B"]})
+    return b
+
+
+@pytest.mark.parametrize("backend", ["mmap", "packed"])
+def test_backend_matches_dense(backend, tmp_path, seeded_brain):
+    dense, other = _run(seeded_brain), _run(seeded_brain, connectome_backend=backend, scratch_dir=str(tmp_path))
+    for x in "AB":
+        assert dense.areas[x].winners == other.areas[x].winners
+        for y in "AB":
+            assert np.array_equal(dense.connectome_view(x, y), other.connectome_view(x, y))
+            assert (dense.connectome_sparse(x, y) != other.connectome_sparse(x, y)).nnz == 0
+    copied = pickle.loads(pickle.dumps(copy.deepcopy(other.connectomes["A"]["B"])))
+    assert np.array_equal(np.asarray(copied), dense.connectome_view("A", "B"))
+
+
+def test_packed_operations_match_dense():
+    rng = np.random.default_rng(0)
+    array = (rng.random((40, 30)) < 0.2).astype(float)
+    array[:5, :5] *= 1.5
+    columns = (rng.random((40, 6)) < 0.2).astype(float)
+    dense, packed = DenseConnectome(array.copy()), PackedConnectome(array.copy())
+    for connectome in (dense, packed):
+        connectome.append_columns(columns)
+        connectome.potentiate([1, 3, 5, 7], [2, 4, 33], 0.5, None, False)
+        connectome.append_rows(np.ones((2, 36)))
+        connectome.potentiate([0, 40], [0, 1], 0.5, 2.0, True)
+    # normalization rescales the columns of a packed connectome as a whole, which rounds differently
+    assert np.allclose(np.asarray(dense), np.asarray(packed), rtol=1e-12)
+    assert np.allclose(dense.input_sums([0, 3, 41]), packed.input_sums([0, 3, 41]))
+    assert dense.count_weights() == packed.count_weights()
+    assert dense.count_weights(np.array([0, 3, 5, 41])) == packed.count_weights(np.array([0, 3, 5, 41]))
+    keep_rows, keep_columns = np.arange(42) % 3 > 0, np.arange(36) % 4 > 0
+    dense.select(keep_rows, keep_columns)
+    packed.select(keep_rows, keep_columns)
+    assert np.allclose(np.asarray(dense), np.asarray(packed))
+
+
+def test_mmap_select_copies_in_chunks(tmp_path, monkeypatch):
+    # a chunk of two rows at a time
+    monkeypatch.setattr(connectome_module, "BATCH_BYTES", 2 * 8 * 32)
+    array = np.random.default_rng(1).random((41, 30))
+    mmap = MmapConnectome(str(tmp_path), array.copy(), column_capacity=32)
+    keep_rows, keep_columns = np.arange(41) % 3 > 0, np.arange(30) % 4 > 0
+    mmap.select(keep_rows, keep_columns)
+    assert np.array_equal(np.asarray(mmap), array[np.ix_(keep_rows, keep_columns)])
@@ -0,0 +1,55 @@
+import numpy as np
+
+from connectome import potentiate
+
+
+def _connectome():
+    rng = np.random.default_rng(0)
+    return (rng.random((20, 15)) < 0.3) * rng.uniform(0.5, 2.0, size=(20, 15))
+
+
+def test_block_update_matches_the_element_loop():
+    connectome, from_winners, new_winners = _connectome(), [1, 4, 7, 9], [0, 3, 14]
+    expected = connectome.copy()
+    for i in new_winners:
+        for j in from_winners:
+            expected[j][i] *= 1.5
+    block = potentiate(connectome, from_winners, new_winners, 0.5)
+    assert np.array_equal(connectome, expected)
+    assert np.array_equal(block, expected[np.ix_(from_winners, new_winners)])
+
+
+def test_max_weight_caps_the_winner_block():
+    connectome, from_winners, new_winners = _connectome(), [1, 4, 7, 9], [0, 3, 14]
+    before = connectome.copy()
+    for _ in range(10):
+        potentiate(connectome, from_winners, new_winners, 0.5, max_weight=2.5)
+    block = np.ix_(from_winners, new_winners)
+    assert np.array_equal(connectome[block], np.where(before[block] > 0, 2.5, 0))
+    connectome[block] = before[block]
+    assert np.array_equal(connectome, before)
+
+
+def test_normalize_keeps_the_incoming_weight_of_winners():
+    connectome, from_winners, new_winners = _connectome(), [1, 4, 7, 9], [0, 3, 14]
+    totals = connectome.sum(axis=0)
+    others = np.setdiff1d(np.arange(20), from_winners)
+    before = connectome.copy()
+    potentiate(connectome, from_winners, new_winners, 0.5, normalize=True)
+    assert np.allclose(connectome.sum(axis=0), totals)
+    # the winners' synapses grew by 1 + beta relative to the other synapses into the same neuron
+    winners, rest = np.ix_(from_winners, new_winners), np.ix_(others, new_winners)
+    ratio = connectome[winners].sum(axis=0) / connectome[rest].sum(axis=0)
+    assert np.allclose(ratio, 1.5 * before[winners].sum(axis=0) / before[rest].sum(axis=0))
+
+
+def test_max_weight_bounds_area_and_stimulus_synapses(seeded_brain):
+    b = seeded_brain(0.05, {"s": 50}, {"A": (5000, 50, 0.2, {"max_weight": 1.5})})
+    b.project({"s": ["A"]}, {})
+    for _ in range(20):
+        b.project({"s": ["A"]}, {"A": ["A"]})
+    assert b.connectome_view("A", "A").max() == 1.5
+    stimuli, baselines = b.stimuli_connectomes["A"], b.stimuli_baselines["A"]
+    assert np.all(stimuli <= 1.5 * baselines)
+    winners = b.areas["A"].winners
+    assert np.array_equal(stimuli[0, winners], 1.5 * baselines[0, winners])
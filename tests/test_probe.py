@@ -0,0 +1,48 @@
+import copy
+
+import numpy as np
+
+
+def _assembly_brain(seeded_brain):
+    b = seeded_brain(0.05, {"s": 50}, {"A": (5000, 50, 0.3)})
+    for _ in range(10):
+        b.project({"s": ["A"]}, {})
+    for _ in range(20):
+        b.project({"s": ["A"]}, {"A": ["A"]})
+    return b
+
+
+def _state(b):
+    area = b.areas["A"]
+    return (list(area.winners), area.support_size, area.rounds, b.connectome_view("A", "A").copy(),
+            b.stimuli_connectomes["A"].copy())
+
+
+def test_probe_leaves_the_brain_and_the_global_generators_unchanged(seeded_brain):
+    b = _assembly_brain(seeded_brain)
+    # fire neurons outside the support as well, whose synapses are drawn during the probe
+    sets = [np.arange(b.areas["A"].support_size - 25, b.areas["A"].support_size + 25)] * 4
+    before, expected = _state(b), copy.deepcopy(b)
+    random_state = np.random.get_state()
+    first = b.probe({"A": sets}, {"s": ["A"]}, {"A": ["A"]}, rounds=3, seed=1)["A"]
+    after, global_state = _state(b), np.random.get_state()
+    assert all(np.array_equal(x, y) for x, y in zip(before, after))
+    assert all(np.array_equal(x, y) for x, y in zip(random_state[1:], global_state[1:]))
+    assert np.array_equal(first, b.probe({"A": sets}, {"s": ["A"]}, {"A": ["A"]}, rounds=3, seed=1)["A"])
+    # later projections are those of a brain that was never probed
+    np.random.set_state(random_state)
+    b.project({"s": ["A"]}, {"A": ["A"]})
+    np.random.set_state(random_state)
+    expected.project({"s": ["A"]}, {"A": ["A"]})
+    assert b.areas["A"].winners == expected.areas["A"].winners
+
+
+def test_probe_completes_the_pattern_of_an_assembly(seeded_brain):
+    b = _assembly_brain(seeded_brain)
+    assembly = np.asarray(b.areas["A"].winners)
+    rng = np.random.default_rng(0)
+    subsets = [rng.choice(assembly, 25, replace=False) for _ in range(8)]
+    completed = b.probe({"A": subsets}, {}, {"A": ["A"]}, rounds=5, seed=0)["A"]
+    assert completed.shape == (8, 50)
+    overlaps = [len(np.intersect1d(winners, assembly)) for winners in completed]
+    assert min(overlaps) >= 40, overlaps
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+ROUTING = ({"stim": ["A"]}, {"A": ["A", "B"], "B": ["B", "C"], "C": ["C", "A"]})
+
+
+def _chain(seeded_brain, backend):
+    b = seeded_brain(0.05, {"stim": 50}, {"A": (5000, 50, 0.05), "B": (5000, 50, 0.05),
+                                          "C": (5000, 50, 0.05, {"max_weight": 2.0})},
+                     track_stats=True, connectome_backend=backend)
+    b.project({"stim": ["A"]}, {})
+    b.project({"stim": ["A"]}, {"A": ["B"]})
+    b.project({}, {"B": ["C"]})
+    return b
+
+
+@pytest.mark.parametrize("backend", ["dense", "packed"])
+def test_result_does_not_depend_on_workers(backend, seeded_brain):
+    sequential, pipelined = _chain(seeded_brain, backend), _chain(seeded_brain, backend)
+    sequential.project_rounds(*ROUTING, rounds=10, seed=7, workers=1)
+    pipelined.project_rounds(*ROUTING, rounds=10, seed=7, workers=3)
+    for x in "ABC":
+        assert np.array_equal(sequential.winners_history(x), pipelined.winners_history(x))
+        assert np.array_equal(sequential.stimuli_connectome_view(x), pipelined.stimuli_connectome_view(x))
+        for y in "ABC":
+            assert np.array_equal(sequential.connectome_view(x, y), pipelined.connectome_view(x, y))
+        for key, values in sequential.stats(x).items():
+            assert np.allclose(values, pipelined.stats(x)[key], equal_nan=True)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_every_round_is_published(workers, seeded_brain, monkeypatch):
+    b = _chain(seeded_brain, "dense")
+    published = []
+    publish = b._publish
+    monkeypatch.setattr(b, "_publish", lambda *args, **kwargs: (publish(*args, **kwargs),
+                                                               published.append(b.snapshot())))
+    start = b.snapshot()
+    b.project_rounds(*ROUTING, rounds=6, seed=7, workers=workers)
+    assert [snapshot.epoch for snapshot in published] == list(range(start.epoch + 1, start.epoch + 7))
+    for t, snapshot in enumerate(published):
+        for x in "ABC":
+            rounds = start.rounds[x] + t + 1
+            assert snapshot.rounds[x] == rounds
+            assert np.array_equal(snapshot.winners[x], b.winners_history(x)[rounds - 1])
+            assert snapshot.support_sizes[x] == b.areas[x].saved_w[rounds - 1]
@@ -0,0 +1,11 @@
+import numpy as np
+
+from result_store import ResultStore
+
+
+def test_numpy_parameters_hit_the_cache(tmp_path):
+    store = ResultStore(str(tmp_path))
+    store.cached("sim", {"n": 10, "beta": 0.5}, lambda: {"x": [1, 2]})
+    assert store.key("sim", {"n": np.int64(10), "beta": np.float64(0.5)}) == store.key("sim", {"n": 10, "beta": 0.5})
+    result = store.cached("sim", {"n": np.int64(10), "beta": np.float64(0.5)}, lambda: {"x": [3]})
+    assert list(result["x"]) == [1, 2]
@@ -0,0 +1,62 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+import brain
+from connectome import DenseConnectome
+from sharded import ShardedBrain
+
+
+def _build(b):
+    b.add_stimulus("s", 50)
+    b.add_area("A", 5000, 50, 0.1)
+    b.add_area("B", 5000, 50, 0.1, max_weight=1.5)
+    return b
+
+
+def _unsharded(sharded):
+    """ A Brain in the state of 'sharded', with its connectomes gathered from the workers. """
+    b = _build(brain.Brain(sharded.p))
+    b.areas = copy.deepcopy(sharded.areas)
+    for x in b.areas:
+        b.stimuli_connectomes[x] = sharded.stimuli_connectome(x)
+        b.stimuli_baselines[x] = np.ones_like(b.stimuli_connectomes[x])
+        for y in b.areas:
+            b.connectomes[x][y] = DenseConnectome(sharded.connectome(x, y))
+    return b
+
+
+def test_sharded_projection_matches_brain():
+    # the random draws after the winners are selected differ, so every projection is compared from the same state
+    routings = [({"s": ["A"]}, {}), ({}, {"A": ["B"], "B": ["B"]}), ({"s": ["A"]}, {"A": ["A"]}),
+                ({}, {"A": ["B"], "B": ["B"]}), ({"s": ["A"]}, {"A": ["A"], "B": ["A"]})]
+    with _build(ShardedBrain(0.05, num_shards=3, shard_size=16, seed=0)) as sharded:
+        for t, (stim_to_area, area_to_area) in enumerate(routings):
+            unsharded = _unsharded(sharded)
+            for b in (sharded, unsharded):
+                random.seed(t)
+                np.random.seed(t)
+                b.project(stim_to_area, area_to_area)
+            for x in "AB":
+                assert sharded.areas[x].winners == unsharded.areas[x].winners
+                assert sharded.areas[x].support_size == unsharded.areas[x].support_size
+                # the synapses among neurons that already existed, including the potentiated winner blocks
+                before = {y: sharded.areas[y].support_size - max(sharded.areas[y].num_first_winners, 0) for y in "AB"}
+                assert np.array_equal(sharded.stimuli_connectome(x)[:, :before[x]],
+                                      unsharded.stimuli_connectomes[x][:, :before[x]])
+                for y in "AB":
+                    assert np.array_equal(sharded.connectome(y, x)[:before[y], :before[x]],
+                                          unsharded.connectomes[y][x][:before[y], :before[x]])
+
+
+def test_sharded_brain_takes_brain_options():
+    with ShardedBrain(0.05, max_idle_rounds=None, connectome_backend="dense", candidate_sampling="order_statistics",
+                      track_stats=True) as sharded:
+        _build(sharded).project({"s": ["A"]}, {})
+        assert sharded.stats("A")["support_size"].tolist() == [50]
+    with pytest.raises(ValueError):
+        ShardedBrain(0.05, max_idle_rounds=2)
+    with pytest.raises(ValueError):
+        ShardedBrain(0.05, connectome_backend="mmap")
@@ -0,0 +1,63 @@
+import asyncio
+import fcntl
+import os
+import threading
+import time
+
+from result_store import ResultStore
+from sim_server import SimServer
+
+SPEC = {"p": 0.05, "seed": 0, "stimuli": [{"name": "stim", "k": 50}],
+        "areas": [{"name": "A", "n": 5000, "k": 50, "beta": 0.05}],
+        "rounds": [{"stim_to_area": {"stim": ["A"]}, "area_to_area": {}},
+                   {"stim_to_area": {"stim": ["A"]}, "area_to_area": {"A": ["A"]}, "repeat": 3}]}
+
+
+def _events(server, spec):
+    async def collect():
+        server._budget = asyncio.Condition()
+        return [event async for event in server.submit(spec)]
+
+    return asyncio.run(collect())
+
+
+def test_malformed_spec_is_reported(tmp_path):
+    server = SimServer(str(tmp_path / "socket"), 1 << 30, 1, ResultStore(str(tmp_path / "store")))
+    for spec in [None, {"p": 0.05, "areas": []}, dict(SPEC, rounds=[{"repeat": -1}]), dict(SPEC, areas=[{"n": 10}])]:
+        events = _events(server, spec)
+        assert [event["event"] for event in events] == ["error"]
+        assert events[0]["message"].startswith("invalid spec")
+
+
+def test_spec_runs_in_a_worker(tmp_path):
+    server = SimServer(str(tmp_path / "socket"), 1 << 30, 1, ResultStore(str(tmp_path / "store")))
+    events = _events(server, SPEC)
+    assert [event["event"] for event in events] == ["queued", "started"] + ["round"] * 4 + ["done"]
+    assert len(events[-1]["result"]["winners"]["A"]) == 50
+
+
+def test_store_lock_does_not_block_the_server(tmp_path):
+    server = SimServer(str(tmp_path / "socket"), 1 << 30, 1, ResultStore(str(tmp_path / "store")))
+    # another process, e.g. a sweep writing to the store, holds its lock for a while
+    lock = open(os.path.join(server.store.root, ".lock"), "w")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    release = threading.Timer(2, fcntl.flock, (lock, fcntl.LOCK_UN))
+    release.start()
+
+    async def run():
+        server._budget = asyncio.Condition()
+        events = asyncio.ensure_future(collect(server.submit(SPEC)))
+        start = time.monotonic()
+        await asyncio.sleep(0.1)
+        waited = time.monotonic() - start
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        return waited, await events
+
+    async def collect(events):
+        return [event async for event in events]
+
+    waited, events = asyncio.run(run())
+    release.cancel()
+    lock.close()
+    assert waited < 1
+    assert events[-1]["event"] == "done"
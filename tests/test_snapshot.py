@@ -0,0 +1,60 @@
+import copy
+import pickle
+import numpy as np
+import pytest
+
+from connectome import DenseConnectome
+
+
+def _brain(seeded_brain, **kwargs):
+    b = seeded_brain(0.05, {"s": 50}, {"A": (5000, 50, 0.1), "B": (5000, 50, 0.1, {"normalize": True})}, **kwargs)
+    b.project({"s": ["A"]}, {})
+    return b
+
+
+def _step(b):
+    b.project({"s": ["A"]}, {"A": ["A", "B"], "B": ["B"]})
+
+
+@pytest.mark.parametrize("snapshot_connectomes", [False, True])
+def test_copy_and_pickle(snapshot_connectomes, seeded_brain):
+    b = _brain(seeded_brain, snapshot_connectomes=snapshot_connectomes)
+    _step(b)
+    copies = [copy.deepcopy(b), pickle.loads(pickle.dumps(b))]
+    for copied in copies:
+        assert copied.snapshot().epoch == b.snapshot().epoch
+        assert copied.snapshot().support_sizes == b.snapshot().support_sizes
+    for stepped in copies + [b]:
+        np.random.seed(1)
+        _step(stepped)
+    for copied in copies:
+        assert copied.areas["B"].winners == b.areas["B"].winners
+        assert copied.snapshot().epoch == b.snapshot().epoch
+
+
+@pytest.mark.parametrize("backend", ["dense", "packed", "mmap"])
+def test_connectomes_stay_frozen(backend, tmp_path, seeded_brain):
+    b = _brain(seeded_brain, snapshot_connectomes=True, connectome_backend=backend, scratch_dir=str(tmp_path))
+    _step(b)
+    first = b.snapshot()
+    expected = {(x, y): b.connectome_view(x, y).copy() for x in "AB" for y in "AB"}
+    for _ in range(5):
+        _step(b)
+    for (x, y), weights in expected.items():
+        assert np.array_equal(first.connectome_view(x, y), weights)
+    assert first.weight_counts("A", "B") == DenseConnectome(expected[("A", "B")]).count_weights()
+    assert np.array_equal(b.snapshot().connectome_view("B", "B"), b.connectome_view("B", "B"))
+
+
+def test_dense_snapshot_copies_only_potentiated_weights():
+    connectome = DenseConnectome(np.ones((4, 3)))
+    grown = connectome.share()
+    connectome.append_columns(np.ones((4, 1)))
+    potentiated = connectome.share()
+    connectome.potentiate([0, 1], [2, 3], 1.0)
+    assert np.shares_memory(grown.view(), grown.view())
+    assert np.array_equal(potentiated.view(), np.ones((4, 4)))
+    assert connectome[0][3] == 2
+    del grown, potentiated
+    connectome.potentiate([0, 1], [2, 3], 1.0)
+    assert connectome[0][3] == 4
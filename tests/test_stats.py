@@ -0,0 +1,35 @@
+import math
+
+import numpy as np
+import pytest
+
+
+def test_stats_match_a_post_hoc_computation(seeded_brain):
+    b = seeded_brain(0.05, {"s": 50}, {"A": (5000, 50, 0.1), "B": (5000, 50, 0.1, {"max_weight": 1.3})},
+                     track_stats=True)
+    b.project({"s": ["A"]}, {})
+    expected = {"mean_winner_weight": [], "assembly_density": []}
+    for _ in range(8):
+        previous = {name: list(area.winners) for name, area in b.areas.items()}
+        b.project({"s": ["A"]}, {"A": ["A", "B"], "B": ["B"]})
+        # the synapses from the previous winners of A and B into the new winners of B, after plasticity
+        blocks = [b.connectome_view(x, "B")[np.ix_(previous[x], b.areas["B"].winners)] for x in "AB"]
+        total, size = sum(block.sum() for block in blocks), sum(block.size for block in blocks)
+        expected["mean_winner_weight"].append(total / size)
+        own = blocks[1]
+        expected["assembly_density"].append(np.count_nonzero(own) / own.size if own.size else math.nan)
+    stats = b.stats("B")
+    history, support = b.winners_history("B"), b.areas["B"].saved_w
+    assert np.array_equal(stats["support_size"], support)
+    assert np.array_equal(stats["num_first_winners"], np.diff(support, prepend=0))
+    overlaps = [0] + [len(np.intersect1d(history[t - 1], history[t])) for t in range(1, len(history))]
+    assert np.array_equal(stats["overlap"], overlaps)
+    assert np.allclose(stats["mean_winner_weight"], expected["mean_winner_weight"])
+    assert np.allclose(stats["assembly_density"], expected["assembly_density"], equal_nan=True)
+
+
+def test_stats_require_tracking(seeded_brain):
+    b = seeded_brain(0.05, {"s": 50}, {"A": (5000, 50, 0.1)})
+    b.project({"s": ["A"]}, {})
+    with pytest.raises(ValueError):
+        b.stats("A")
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def test_stimulus_store_has_a_row_per_stimulus(seeded_brain):
+    b = seeded_brain(0.05, {"s": 50, "t": 30}, {"A": (5000, 50, 0.1)})
+    b.project({"s": ["A"]}, {})
+    stimuli = b.stimuli_connectomes["A"]
+    assert stimuli.shape == (2, 50)
+    assert b.stimulus_rows == {"s": 0, "t": 1}
+    # the winners' synapses from the firing stimulus are potentiated, the others keep their Binomial(k, p) draw
+    baseline = b.stimuli_baselines["A"]
+    assert np.array_equal(stimuli[0], baseline[0] * 1.1)
+    assert np.array_equal(stimuli[1], baseline[1])
+    # the first winners are the neurons with the largest inputs, far above the mean k * p
+    assert baseline[0].min() > 50 * 0.05
+    assert np.all(stimuli[1] <= 30)
+
+
+def test_stimulus_added_after_the_support_grew(seeded_brain):
+    b = seeded_brain(0.05, {"s": 50}, {"A": (5000, 50, 0.1)})
+    b.project({"s": ["A"]}, {})
+    b.project({"s": ["A"]}, {"A": ["A"]})
+    support_size = b.areas["A"].support_size
+    b.add_stimulus("late", 40)
+    row = b.stimuli_connectomes["A"][b.stimulus_rows["late"]]
+    assert len(row) == support_size
+    assert np.all((row >= 0) & (row <= 40)) and 0 < row.mean() < 40 * 0.05 * 2
+    b.project({"late": ["A"]}, {"A": ["A"]})
+    assert b.stimuli_connectomes["A"].shape == (2, b.areas["A"].support_size)
+    winners = b.areas["A"].winners
+    late = b.stimulus_rows["late"]
+    assert np.allclose(b.stimuli_connectomes["A"][late, winners], b.stimuli_baselines["A"][late, winners] * 1.1)
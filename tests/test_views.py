@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+
+def _brain(seeded_brain, **kwargs):
+    b = seeded_brain(0.05, {"s": 50}, {"A": (5000, 50, 0.1), "B": (5000, 50, 0.1)}, **kwargs)
+    b.project({"s": ["A"]}, {})
+    for _ in range(5):
+        b.project({"s": ["A"]}, {"A": ["A", "B"], "B": ["B"]})
+    return b
+
+
+@pytest.mark.parametrize("backend", ["dense", "mmap"])
+def test_views_are_read_only_and_not_copied(backend, tmp_path, seeded_brain):
+    b = _brain(seeded_brain, connectome_backend=backend, scratch_dir=str(tmp_path))
+    connectome = b.connectomes["A"]["B"]
+    views = [(b.connectome_view("A", "B"), connectome.array),
+             (b.stimuli_connectome_view("A"), b.stimuli_connectomes["A"]),
+             (b.winners_history("A"), b.areas["A"]._saved_winners)]
+    for view, owner in views:
+        assert np.shares_memory(view, owner)
+        with pytest.raises(ValueError):
+            view[0, 0] = 7
+    assert b.connectome_view("A", "B").shape == connectome.shape
+    assert np.array_equal(b.connectome_sparse("A", "B").toarray(), b.connectome_view("A", "B"))
+
+
+def test_history_views_survive_compaction(seeded_brain):
+    b = _brain(seeded_brain)
+    b.project({}, {"B": ["A"]})
+    history = b.winners_history("A")
+    before = history.copy()
+    assert sum(b.compact(1).values()) > 0
+    assert np.array_equal(history, before)
+    assert b.winners_history("A").shape == before.shape
+    assert not np.array_equal(b.winners_history("A"), before)
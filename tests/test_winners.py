@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import brain
+
+
+def test_batch_selection_matches_single_selection():
+    rng = np.random.default_rng(0)
+    support_size, k = 30, 10
+    values = rng.integers(0, 8, size=(200, support_size + k)).astype(float)
+    winners = brain.Brain._batch_select_winners(values, k, support_size)
+    for row, batch_winners in zip(values, winners):
+        area = brain.Area("A", 1000, k)
+        area.support_size = support_size
+        brain.Brain._select_winners(area, np.arange(support_size), row[:support_size], row[support_size:])
+        assert area._new_winners == batch_winners.tolist()
+
+
+def test_order_statistics_match_the_largest_binomial_inputs():
+    stats = pytest.importorskip("scipy.stats")
+    np.random.seed(0)
+    b = brain.Brain(0.1, candidate_sampling="order_statistics")
+    area = brain.Area("A", 2000, 10)
+    total_k, trials = 100, 400
+    sampled = np.array([b._order_statistic_candidates(area, total_k, np.zeros(0)) for _ in range(trials)])
+    exact = -np.sort(-np.random.binomial(total_k, 0.1, size=(trials, area.n)), axis=1)[:, :area.k]
+    assert np.all(np.diff(sampled, axis=1) <= 0)
+    for j in (0, area.k - 1):
+        assert stats.mannwhitneyu(sampled[:, j], exact[:, j]).pvalue > 0.01
+
+
+def test_order_statistics_stop_at_the_first_losing_input():
+    np.random.seed(1)
+    b = brain.Brain(0.1, candidate_sampling="order_statistics")
+    area = brain.Area("A", 2000, 10)
+    support_inputs = np.full(area.k, 18.0)
+    counts = []
+    for _ in range(400):
+        candidates = b._order_statistic_candidates(area, 100, support_inputs)
+        assert np.all(candidates > 18)
+        counts.append(len(candidates))
+    exact = (np.random.binomial(100, 0.1, size=(400, area.n)) > 18).sum(axis=1).clip(max=area.k)
+    assert abs(np.mean(counts) - np.mean(exact)) < 0.25
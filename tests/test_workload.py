@@ -0,0 +1,53 @@
+import copy
+
+import pytest
+
+import brain
+from sharded import ShardedBrain
+from workload import Recorder, replay
+
+
+def _simulation(rounds=True):
+    b = brain.Brain(0.05)
+    b.add_stimulus("s", 50)
+    b.add_area("A", 5000, 50, 0.1)
+    b.add_area("B", 5000, 50, 0.1)
+    b.project({"s": ["A"]}, {})
+    for _ in range(3):
+        b.project({"s": ["A"]}, {"A": ["A", "B"]})
+    # winners assigned by hand, as in pattern completion experiments: the neurons that joined the support last
+    b.areas["A"].winners = list(range(b.areas["A"].support_size - 25, b.areas["A"].support_size))
+    b.project({}, {"A": ["A"]})
+    if rounds:
+        copied = copy.deepcopy(b)
+        copied.project({"s": ["A"]}, {"A": ["A", "B"], "B": ["B"]})
+        b.project_rounds({"s": ["A"]}, {"A": ["A", "B"], "B": ["B"]}, rounds=3, seed=1)
+
+
+def _record(path, **kwargs):
+    with Recorder(str(path), seed=3):
+        _simulation(**kwargs)
+    return str(path)
+
+
+def test_replay_reproduces_the_trace(tmp_path):
+    trace = _record(tmp_path / "trace.gz")
+    report = replay(trace)
+    assert report.mismatches == []
+    assert report.projections == 6 + 3
+    assert len(report.timings["project"]) == 6
+
+
+def test_replay_reports_diverging_configurations(tmp_path):
+    trace = _record(tmp_path / "trace.gz")
+    report = replay(trace, candidate_sampling="order_statistics")
+    assert report.mismatches
+    assert report.projections == 6 + 3
+
+
+def test_replay_on_a_sharded_brain(tmp_path):
+    trace = _record(tmp_path / "trace.gz", rounds=False)
+    report = replay(trace, brain_factory=ShardedBrain)
+    assert report.projections == 5
+    with pytest.raises(NotImplementedError):
+        replay(_record(tmp_path / "copies.gz"), brain_factory=ShardedBrain)
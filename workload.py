@@ -0,0 +1,227 @@
+""" Capture of brain workloads to trace files, and deterministic replay of them for performance testing.
+
+A Recorder logs every 'add_stimulus', 'add_area' and 'project' of every Brain created while it is active, together
+with the seed of the random generators. Before each of these operations the generators of 'random' and 'numpy.random'
+are reseeded from the seed and the operation's position in the trace, so random numbers drawn by the simulation
+code itself between operations do not affect the replay. Winners assigned by hand (as in 'pattern_com', which sets
+'b.areas["A"].winners' directly) are detected at the next projection and logged as well, and so are deep copies of a
+recorded brain (as in 'pattern_com_alphas'). After each projection the trace keeps a checksum of the winners of all
+areas, so 'replay' can check that another engine configuration computes the same winners.
+
+Recording an existing simulation needs no change to its code:
+    with Recorder("associate.trace.gz", seed=0):
+        simulations.associate(n=10000, k=100)
+
+and replaying it against some configuration reports timings per operation and any winner mismatches:
+    print(replay("associate.trace.gz", max_idle_rounds=5).summary())
+    print(replay("associate.trace.gz", brain_factory=sharded.ShardedBrain, num_shards=4).summary())
+
+The same is available from the command line:
+    python workload.py record associate.trace.gz simulations:associate '{"n": 10000, "k": 100}' --seed 0
+    python workload.py replay associate.trace.gz
+"""
+import argparse
+import copy
+import gzip
+import importlib
+import json
+import random
+import sys
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, Callable, Dict, IO, List, Optional, Tuple
+
+import numpy as np
+
+import brain
+
+TRACE_VERSION = 1
+
+
+def winners_checksum(winners: List[int]) -> int:
+    """ A compact fingerprint of a list of winners (order matters). """
+    return zlib.crc32(np.asarray(winners, dtype=np.int64).tobytes())
+
+
+def _seed(seed: int, operation: int = 0) -> None:
+    """ Seed the global generators for the given operation of a trace. """
+    state = int(np.random.SeedSequence([seed, operation]).generate_state(1)[0])
+    random.seed(state)
+    np.random.seed(state)
+
+
+class Recorder:
+    """ Records the operations of all brains created while it is active (as a context manager) to a trace file.
+
+    The trace is a gzipped file of JSON lines: a header with the seed, then one line per operation, each naming the
+    brain it applies to by its order of creation.
+    """
+
+    def __init__(self, path: str, seed: int = 0):
+        self.path = path
+        self.seed = seed
+        self._file: Optional[IO[str]] = None
+        self._num_brains = 0
+        self._num_operations = 0
+        self._ids: Dict[int, int] = {}
+        self._previous_recorder: Optional[Any] = None
+
+    def __enter__(self) -> "Recorder":
+        self._file = gzip.open(self.path, "wt")
+        self._write({"version": TRACE_VERSION, "seed": self.seed})
+        _seed(self.seed)
+        self._previous_recorder = brain.active_recorder
+        brain.active_recorder = self
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        brain.active_recorder = self._previous_recorder
+        self._file.close()
+        self._file = None
+
+    def _write(self, line: Dict[str, Any]) -> None:
+        if self._file is not None:
+            self._file.write(json.dumps(line) + "\n")
+
+    def _id(self, b: brain.Brain) -> int:
+        return self._ids[id(b)]
+
+    def new_brain(self, b: brain.Brain, kwargs: Dict[str, Any]) -> None:
+        self._ids[id(b)] = self._num_brains
+        self._num_brains += 1
+        self._write({"op": "brain", "brain": self._id(b), "kwargs": kwargs})
+
+    def copied(self, b: brain.Brain, copied: brain.Brain) -> None:
+        self._ids[id(copied)] = self._num_brains
+        self._num_brains += 1
+        self._write({"op": "copy", "brain": self._id(b), "copy": self._id(copied)})
+
+    def before(self, b: brain.Brain, op: str) -> None:
+        """ Called at the start of an operation: log winners assigned by hand and reseed the generators. """
+        if op in ("project", "project_rounds"):
+            for name, area in b.areas.items():
+                if area.winners is not area._new_winners:
+                    self._write({"op": "set_winners", "brain": self._id(b), "area": name,
+                                 "winners": list(map(int, area.winners))})
+                    area._new_winners = area.winners
+        self._num_operations += 1
+        _seed(self.seed, self._num_operations)
+
+    def record(self, b: brain.Brain, op: str, *args: Any) -> None:
+        line = {"op": op, "brain": self._id(b), "args": args}
+        if op in ("project", "project_rounds"):
+            line["checksums"] = {name: winners_checksum(area.winners) for name, area in b.areas.items()}
+        self._write(line)
+
+
+class ReplayReport:
+    """ The outcome of a replay.
+
+    Attributes:
+        timings: Wall time in seconds of each replayed operation, by operation name.
+        mismatches: (line number, brain, area) of every projection after which the winners differ from the trace, and
+            of every assignment of winners by hand that is out of the support of the replayed brain (which happens
+            once a configuration that draws different random numbers has diverged from the trace).
+        projections: Number of replayed projections (counting each round of 'project_rounds').
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.mismatches: List[Tuple[int, int, str]] = []
+        self.projections = 0
+
+    @property
+    def total_time(self) -> float:
+        return sum(sum(times) for times in self.timings.values())
+
+    def summary(self) -> str:
+        lines = ["%-14s %6d calls %10.3f s" % (op, len(times), sum(times)) for op, times in self.timings.items()]
+        lines.append("total %.3f s, %d projections, %d winner mismatches" %
+                     (self.total_time, self.projections, len(self.mismatches)))
+        return "\n".join(lines)
+
+
+def replay(path: str, brain_factory: Callable[..., brain.Brain] = brain.Brain, check: bool = True,
+           **brain_kwargs: Any) -> ReplayReport:
+    """ Re-execute a trace, timing every operation.
+
+    :param brain_factory: Creates the brains of the trace, e.g. a Brain subclass. It receives the recorded arguments
+        of each brain, overridden by 'brain_kwargs'.
+    :param check: Compare the winners after each projection with the recorded checksums.
+    """
+    report = ReplayReport()
+    brains: Dict[int, brain.Brain] = {}
+    try:
+        _replay(path, brain_factory, check, brain_kwargs, report, brains)
+    finally:
+        for b in brains.values():
+            # e.g. the worker processes of a 'sharded.ShardedBrain'
+            if hasattr(b, "close"):
+                b.close()
+    return report
+
+
+def _replay(path: str, brain_factory: Callable[..., brain.Brain], check: bool, brain_kwargs: Dict[str, Any],
+            report: ReplayReport, brains: Dict[int, brain.Brain]) -> None:
+    """ Re-execute the trace at 'path' into 'report', keeping the brains it creates in 'brains'. """
+    with gzip.open(path, "rt") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != TRACE_VERSION:
+            raise ValueError("Unsupported trace version %s" % header.get("version"))
+        num_operations = 0
+        for line_number, text in enumerate(f, start=2):
+            line = json.loads(text)
+            op = line["op"]
+            if op not in ("brain", "copy", "set_winners"):
+                num_operations += 1
+                _seed(header["seed"], num_operations)
+            start = time.perf_counter()
+            if op == "brain":
+                brains[line["brain"]] = brain_factory(**dict(line["kwargs"], **brain_kwargs))
+            elif op == "copy":
+                brains[line["copy"]] = copy.deepcopy(brains[line["brain"]])
+            elif op == "set_winners":
+                area = brains[line["brain"]].areas[line["area"]]
+                if all(0 <= winner < area.support_size for winner in line["winners"]):
+                    area.winners = line["winners"]
+                else:
+                    report.mismatches.append((line_number, line["brain"], line["area"]))
+            else:
+                getattr(brains[line["brain"]], op)(*line["args"])
+            report.timings[op].append(time.perf_counter() - start)
+            if op in ("project", "project_rounds"):
+                report.projections += line["args"][2] if op == "project_rounds" else 1
+                if check:
+                    b = brains[line["brain"]]
+                    for name, checksum in line["checksums"].items():
+                        if winners_checksum(b.areas[name].winners) != checksum:
+                            report.mismatches.append((line_number, line["brain"], name))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record or replay brain workload traces.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record = subparsers.add_parser("record", help="run module:function and record its brains")
+    record.add_argument("trace")
+    record.add_argument("function", help="e.g. simulations:associate")
+    record.add_argument("kwargs", nargs="?", default="{}", help="JSON keyword arguments of the function")
+    record.add_argument("--seed", type=int, default=0)
+    record.add_argument("--path", action="append", default=[], help="directory to import the module from")
+    play = subparsers.add_parser("replay")
+    play.add_argument("trace")
+    play.add_argument("brain_kwargs", nargs="?", default="{}", help="JSON keyword arguments overriding Brain's")
+    play.add_argument("--no-check", action="store_true")
+    args = parser.parse_args()
+    if args.command == "record":
+        sys.path[:0] = args.path
+        module_name, function_name = args.function.split(":")
+        function = getattr(importlib.import_module(module_name), function_name)
+        with Recorder(args.trace, args.seed):
+            function(**json.loads(args.kwargs))
+    else:
+        print(replay(args.trace, check=not args.no_check, **json.loads(args.brain_kwargs)).summary())
+
+
+if __name__ == "__main__":
+    main()